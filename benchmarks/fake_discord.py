@@ -0,0 +1,386 @@
+"""
+Couche Discord factice pour les benchmarks hors ligne.
+
+Guild / TextChannel / Message / Interaction locaux, avec une latence REST injectable :
+chaque appel qui serait un aller-retour HTTP passe par FakeRest.hit(), qui compte l'appel
+et attend `latency` secondes.
+"""
+import asyncio, itertools
+from collections import Counter
+from datetime import datetime, timezone
+import discord
+
+_ids = itertools.count(discord.utils.time_snowflake(datetime(2025, 1, 1, tzinfo=timezone.utc)), 1 << 22)
+
+def next_id() -> int:
+    return next(_ids)
+
+class FakeRest:
+    def __init__(self, latency: float = 0.0):
+        self.latency = latency
+        self.calls = Counter()
+
+    async def hit(self, route: str):
+        self.calls[route] += 1
+        if self.latency:
+            await asyncio.sleep(self.latency)
+
+    def total(self) -> int:
+        return sum(self.calls.values())
+
+class FakeUser:
+    def __init__(self, id: int, name: str = "user", bot: bool = False):
+        self.id = id
+        self.name = name
+        self.bot = bot
+
+    @property
+    def mention(self) -> str:
+        return f"<@{self.id}>"
+
+    def __str__(self):
+        return self.name
+
+    def __eq__(self, other):
+        return getattr(other, "id", None) == self.id
+
+    def __hash__(self):
+        return hash(self.id)
+
+class FakeRole:
+    def __init__(self, id: int):
+        self.id = id
+
+class FakeAttachment:
+    def __init__(self, url: str, content_type: str = "image/png", id: int | None = None, size: int = 0):
+        self.id = id or next_id()
+        self.url = url
+        self.content_type = content_type
+        self.filename = url.rsplit("/", 1)[-1]
+        self.size = size
+
+class FakeMessage:
+    def __init__(self, rest: FakeRest, channel, author, content="", embeds=None, attachments=None, reference=None):
+        self.rest = rest
+        self.id = next_id()
+        self.created_at = discord.utils.snowflake_time(self.id)
+        self.channel = channel
+        self.guild = getattr(channel, "guild", None)
+        self.author = author
+        self.content = content or ""
+        self.embeds = list(embeds or [])
+        self.attachments = list(attachments or [])
+        self.reference = reference
+        self.deleted = False
+        self.uploaded: list[bytes] = []  # contenu des fichiers reçus via edit(attachments=)
+        self._state = None  # lu par commands.Context, jamais utilisé pour des appels
+
+    @property
+    def jump_url(self) -> str:
+        gid = getattr(self.guild, "id", "@me")
+        return f"https://discord.com/channels/{gid}/{getattr(self.channel, 'id', 0)}/{self.id}"
+
+    async def delete(self):
+        await self.rest.hit("message.delete")
+        self.deleted = True
+        if self.channel is not None:
+            self.channel._messages.pop(self.id, None)
+
+    async def edit(self, *, content=None, embed=None, embeds=None, view=None, attachments=None, **kwargs):
+        await self.rest.hit("message.edit")
+        if content is not None:
+            self.content = content
+        if embed is not None:
+            self.embeds = [embed]
+        if embeds is not None:
+            self.embeds = list(embeds)
+        if attachments is not None:
+            # Comme l'API : pièces jointes gardées + fichiers uploadés, attachment://nom résolu dans les embeds
+            kept = [a for a in attachments if isinstance(a, FakeAttachment)]
+            uploads = {}
+            for f in attachments:
+                if isinstance(f, discord.File):
+                    a = FakeAttachment(f"https://cdn.fake/attachments/{self.channel.id}/{next_id()}/{f.filename}", size=0)
+                    a.filename = f.filename
+                    uploads[f"attachment://{f.filename}"] = a
+                    self.uploaded.append(f.fp.read())
+                    f.close()
+            self.attachments = kept + list(uploads.values())
+            for e in self.embeds:
+                if e.image and e.image.url in uploads:
+                    e.set_image(url=uploads[e.image.url].url)
+        return self
+
+    async def pin(self):
+        await self.rest.hit("message.pin")
+
+class FakeTextChannel(discord.TextChannel):
+    """Sous-classe de discord.TextChannel pour passer les isinstance() du bot."""
+    def __init__(self, rest: FakeRest, guild, id: int, name: str, category_id: int | None = None, topic: str | None = None):
+        self.rest = rest
+        self.guild = guild
+        self.id = id
+        self.name = name
+        self.category_id = category_id
+        self.topic = topic
+        self.position = 0
+        self._messages: dict[int, FakeMessage] = {}
+        self._overwrites = []
+        self._ow: dict = {}  # cible -> discord.PermissionOverwrite
+        self.perms: dict[int, dict] = {}
+
+    def __repr__(self):
+        return f"<FakeTextChannel {self.name}>"
+
+    def add_message(self, author, content="", embeds=None, attachments=None, reference=None) -> FakeMessage:
+        m = FakeMessage(self.rest, self, author, content, embeds, attachments, reference)
+        self._messages[m.id] = m
+        return m
+
+    async def history(self, *, limit=100, before=None, after=None, around=None, oldest_first=None):
+        # Une page REST par tranche de 100 messages
+        msgs = sorted(self._messages.values(), key=lambda m: m.id, reverse=not (oldest_first or after))
+        if after is not None:
+            msgs = [m for m in msgs if m.id > after.id]
+        if before is not None:
+            msgs = [m for m in msgs if m.id < before.id]
+        if limit is not None:
+            msgs = msgs[:limit]
+        for idx, m in enumerate(msgs):
+            if idx % 100 == 0:
+                await self.rest.hit("channel.history")
+            yield m
+
+    async def send(self, content=None, *, embed=None, embeds=None, view=None, **kwargs):
+        await self.rest.hit("channel.send")
+        return self.add_message(self.guild.me, content or "", [embed] if embed else embeds)
+
+    async def fetch_message(self, id: int):
+        await self.rest.hit("channel.fetch_message")
+        try:
+            return self._messages[id]
+        except KeyError:
+            raise discord.NotFound(_FakeResponse(404), "Unknown Message")
+
+    def get_partial_message(self, id: int) -> "FakePartialMessage":
+        return FakePartialMessage(self, id)
+
+    async def delete_messages(self, messages, **kwargs):
+        await self.rest.hit("channel.delete_messages")
+        for m in messages:
+            m.deleted = True
+            self._messages.pop(m.id, None)
+
+    @property
+    def overwrites(self) -> dict:
+        return dict(self._ow)
+
+    async def set_permissions(self, target, **perms):
+        await self.rest.hit("channel.set_permissions")
+        self.perms[target.id] = perms
+        self._ow[target] = discord.PermissionOverwrite(**perms)
+
+    async def edit(self, **kwargs):
+        await self.rest.hit("channel.edit")
+        for k, v in kwargs.items():
+            if k in ("topic", "name"):
+                setattr(self, k, v)
+        if "overwrites" in kwargs:
+            self._ow = dict(kwargs["overwrites"])
+        return self
+
+    async def delete(self, **kwargs):
+        await self.rest.hit("channel.delete")
+        self.guild.channels.pop(self.id, None)
+        cat = self.guild.channels.get(self.category_id)
+        if cat is not None and self in cat.text_channels:
+            cat.text_channels.remove(self)
+
+class FakePartialMessage:
+    """Comme discord.PartialMessage : édition sans lecture préalable."""
+    def __init__(self, channel: FakeTextChannel, id: int):
+        self.channel = channel
+        self.id = id
+
+    @property
+    def jump_url(self) -> str:
+        return f"https://discord.com/channels/{self.channel.guild.id}/{self.channel.id}/{self.id}"
+
+    async def edit(self, **kwargs):
+        m = self.channel._messages.get(self.id)
+        if m is None:
+            await self.channel.rest.hit("message.edit")
+            raise discord.NotFound(_FakeResponse(404), "Unknown Message")
+        return await m.edit(**kwargs)
+
+class FakeCategory:
+    def __init__(self, guild, id: int, name: str = "tickets"):
+        self.guild = guild
+        self.id = id
+        self.name = name
+        self.text_channels: list[FakeTextChannel] = []
+
+    @property
+    def channels(self):
+        return self.text_channels
+
+class FakeGuild:
+    def __init__(self, rest: FakeRest, id: int, me: FakeUser):
+        self.rest = rest
+        self.id = id
+        self.me = me
+        self.default_role = FakeRole(id)
+        self.channels: dict[int, object] = {}
+        self.members: dict[int, FakeUser] = {me.id: me}
+        self.filesize_limit = 10 * 1024 * 1024
+        self.gateway_lag = False  # True : les salons créés n'entrent dans le cache qu'à deliver_events()
+        self._events: list = []
+
+    def get_channel(self, id: int):
+        return self.channels.get(id)
+
+    def get_member(self, id: int):
+        return self.members.get(id)
+
+    def add_member(self, user: FakeUser) -> FakeUser:
+        self.members[user.id] = user
+        return user
+
+    def add_category(self, id: int) -> FakeCategory:
+        c = self.channels[id] = FakeCategory(self, id)
+        return c
+
+    def add_text_channel(self, id: int, name: str, category: FakeCategory | None = None, topic=None) -> FakeTextChannel:
+        ch = FakeTextChannel(self.rest, self, id, name, category.id if category else None, topic)
+        self.channels[id] = ch
+        if category:
+            category.text_channels.append(ch)
+        return ch
+
+    async def create_text_channel(self, name, *, category=None, overwrites=None, topic=None, **kwargs):
+        await self.rest.hit("guild.create_text_channel")
+        if category is not None and len(category.text_channels) >= 50:
+            raise discord.HTTPException(_FakeResponse(400), "Maximum number of channels in category reached (50)")
+        if self.gateway_lag:
+            ch = FakeTextChannel(self.rest, self, next_id(), name, category.id if category else None, topic)
+            self._events.append((ch, category))
+        else:
+            ch = self.add_text_channel(next_id(), name, category, topic)
+        ch._ow = dict(overwrites or {})
+        return ch
+
+    def deliver_events(self):
+        """Arrivée des CHANNEL_CREATE : les salons créés entrent dans le cache."""
+        for ch, category in self._events:
+            self.channels[ch.id] = ch
+            if category is not None:
+                category.text_channels.append(ch)
+        self._events.clear()
+
+class _FakeResponse:
+    """Réponse aiohttp minimale pour construire les exceptions HTTP de discord.py."""
+    def __init__(self, status: int):
+        self.status = status
+        self.reason = "fake"
+
+class FakeInteractionResponse:
+    def __init__(self, interaction):
+        self._parent = interaction
+        self._done = False
+
+    def is_done(self) -> bool:
+        return self._done
+
+    async def _ack(self, route):
+        if self._done:
+            raise discord.InteractionResponded(self._parent)
+        await self._parent.rest.hit(route)
+        self._done = True
+
+    async def send_message(self, content=None, *, embed=None, view=None, ephemeral=False, **kwargs):
+        await self._ack("interaction.send_message")
+        self._parent._original = FakeMessage(self._parent.rest, self._parent.channel, self._parent.guild.me if self._parent.guild else None,
+                                        content or "", [embed] if embed else None)
+        self._parent.view = view
+
+    async def edit_message(self, *, view=None, **kwargs):
+        await self._ack("interaction.edit_message")
+        self._parent.view = view
+
+    async def defer(self, **kwargs):
+        await self._ack("interaction.defer")
+
+class FakeFollowup:
+    def __init__(self, interaction):
+        self._parent = interaction
+
+    async def send(self, content=None, **kwargs):
+        await self._parent.rest.hit("followup.send")
+        return FakeMessage(self._parent.rest, self._parent.channel, self._parent.guild.me, content or "")
+
+class FakeInteraction:
+    def __init__(self, rest: FakeRest, guild: FakeGuild, user: FakeUser, channel=None, message=None, custom_id: str | None = None):
+        self.rest = rest
+        self.id = next_id()
+        self.guild = guild
+        self.user = user
+        self.channel = channel
+        self.message = message
+        self.data = {"custom_id": custom_id} if custom_id else {}
+        self.created_at = datetime.now(timezone.utc)
+        self.response = FakeInteractionResponse(self)
+        self.followup = FakeFollowup(self)
+        self._original = None
+        self.view = None  # dernière vue envoyée / éditée via la réponse
+
+    async def original_response(self):
+        await self.rest.hit("interaction.original_response")
+        return self._original
+
+    async def edit_original_response(self, **kwargs):
+        await self.rest.hit("interaction.edit_original_response")
+        return self._original
+
+class FakeCDN:
+    """
+    Serveur HTTP local qui remplace le CDN des pièces jointes.
+    /img/<graine>.png renvoie des octets déterministes : même graine => même contenu.
+    """
+    def __init__(self, size: int = 200_000, delay: float = 0.0):
+        self.size = size
+        self.delay = delay  # latence de téléchargement simulée
+        self.hits = 0
+        self._runner = None
+        self.base = ""
+
+    async def _img(self, request):
+        from aiohttp import web
+        self.hits += 1
+        if self.delay:
+            await asyncio.sleep(self.delay)
+        seed = request.match_info["seed"].encode()
+        return web.Response(body=(seed * (self.size // len(seed) + 1))[:self.size], content_type="image/png")
+
+    async def start(self):
+        from aiohttp import web
+        app = web.Application()
+        app.router.add_get("/img/{seed}.png", self._img)
+        self._runner = web.AppRunner(app)
+        await self._runner.setup()
+        site = web.TCPSite(self._runner, "127.0.0.1", 0)
+        await site.start()
+        port = site._server.sockets[0].getsockname()[1]
+        self.base = f"http://127.0.0.1:{port}"
+        return self
+
+    async def stop(self):
+        if self._runner:
+            await self._runner.cleanup()
+
+    def attachment(self, seed) -> FakeAttachment:
+        return FakeAttachment(f"{self.base}/img/{seed}.png", size=self.size)
+
+class FakeReference:
+    def __init__(self, message_id: int):
+        self.message_id = message_id
+        self.resolved = None
@@ -0,0 +1,322 @@
+"""
+Benchmarks hors ligne des chemins chauds du bot (aucune guilde réelle nécessaire).
+
+    python benchmarks/run.py                      # écrit bench_results.json
+    python benchmarks/run.py --latency-ms 80      # latence REST simulée par appel
+    python benchmarks/run.py --compare old.json   # compare à un run précédent
+
+Chaque cas rapporte le temps par itération (moyenne, p50, p95) et le nombre d'appels REST simulés.
+"""
+import os, sys, json, time, atexit, shutil, asyncio, argparse, platform, subprocess, tempfile
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+sys.path.insert(0, str(Path(__file__).resolve().parent))
+
+# Store isolé : ne jamais toucher aux données réelles
+os.environ["DATA_DIR"] = tempfile.mkdtemp(prefix="bench-")
+os.environ.pop("TRANSCRIPTS_DIR", None)
+atexit.register(shutil.rmtree, os.environ["DATA_DIR"], True)
+os.environ.pop("DB_PATH", None)
+
+import discord
+import main
+from fake_discord import (
+    FakeRest, FakeUser, FakeGuild, FakeInteraction, FakeCDN, FakeReference, next_id
+)
+
+def percentile(xs: list[float], q: float) -> float:
+    xs = sorted(xs)
+    return xs[min(len(xs) - 1, int(round(q * (len(xs) - 1))))]
+
+class World:
+    """Guilde factice câblée sur les ids de configuration du bot."""
+    def __init__(self, latency: float, n_channels: int = 0):
+        self.rest = FakeRest(latency)
+        self.me = FakeUser(next_id(), "bot", bot=True)
+        main.bot._connection.user = self.me
+        self.g = FakeGuild(self.rest, main.GUILD_ID, self.me)
+        self.owner = self.g.add_member(FakeUser(main.OWNER_ID, "owner"))
+        self.passeur = self.g.add_member(FakeUser(next_id(), "passeur"))
+        self.client = self.g.add_member(FakeUser(next_id(), "client"))
+        self.cat = self.g.add_category(main.NEW_CATEGORY_ID)
+        self.feedback = self.g.add_text_channel(main.FEEDBACK_CHANNEL_ID, "feedback")
+        self.screens = self.g.add_text_channel(main.SCREEN_CHANNEL_ID, "screens")
+        self.demands = self.g.add_text_channel(main.DEMANDS_CHANNEL_ID, "demandes")
+        self.wakeup = self.g.add_text_channel(main.WAKEUP_CHANNEL_ID, "wakeup")
+        for k in range(n_channels):
+            self.g.add_text_channel(next_id(), f"{main.TICKET_PREFIX}-{k + 1:03d}", self.cat)
+        self.teardown = []  # coroutines lancées après le cas
+
+    def interaction(self, user, custom_id=None, channel=None, message=None):
+        return FakeInteraction(self.rest, self.g, user, channel=channel, message=message, custom_id=custom_id)
+
+    def ticket_channel(self, filler: int = 0):
+        ch = self.g.add_text_channel(next_id(), f"{main.TICKET_PREFIX}-bench", self.cat, topic="Passage dès que possible")
+        recap = main.make_summary_embed(self.client, "Pandala", "Tanu", "Nomade, Duo", "Passage dès que possible")
+        ch.add_message(self.me, f"{self.client.mention} • {self.passeur.mention}", [recap])
+        for k in range(filler):
+            ch.add_message(self.client, f"message {k}")
+        return ch
+
+    def feedback_message(self, par: FakeUser, pour: FakeUser):
+        e = discord.Embed(title="Passage effectué !", color=0x2ECC71)
+        e.add_field(name="Par", value=par.mention, inline=False)
+        e.add_field(name="Pour", value=pour.mention, inline=False)
+        e.add_field(name="Donjon", value="Tanu", inline=False)
+        e.add_field(name="💬 Commentaires", value="*(Aucun commentaire pour le moment)*", inline=False)
+        return self.feedback.add_message(self.me, "", [e])
+
+async def settle():
+    """Attend les tâches lancées par le routeur de messages."""
+    while main.background_tasks:
+        await asyncio.gather(*list(main.background_tasks), return_exceptions=True)
+
+async def click(view, i):
+    """Reproduit le dispatch discord.py : interaction_check puis callback de l'item visé."""
+    if not await view.interaction_check(i):
+        return
+    cid = i.data.get("custom_id")
+    for item in view.children:
+        if getattr(item, "custom_id", None) == cid:
+            await item.callback(i)
+            return
+
+async def click_dynamic(cls, view, label, i):
+    """Dispatch d'un DynamicItem : custom_id -> from_custom_id -> callback (vue reconstruite)."""
+    item = next(x.item for x in view.children if x.item.label == label)
+    m = cls.__discord_ui_compiled_template__.fullmatch(item.custom_id)
+    await (await cls.from_custom_id(i, item, m)).callback(i)
+    return i.view
+
+# =========================
+# Cas
+# =========================
+async def bench_next_ticket_name(w: World, it: int):
+    n = 0
+    async def seeded():
+        nonlocal n
+        n += 1
+        await main.next_ticket_name(w.g.id, w.cat, f"bench-seed-{n}")  # préfixe neuf => amorçage par scan
+    async def steady():
+        await main.next_ticket_name(w.g.id, w.cat, main.TICKET_PREFIX)
+    return {"seed_scan": seeded, "steady": steady}
+
+async def bench_labels(w: World, it: int):
+    sel = ["tanu_nomade", "tanu_blitz", "tanu_duo"]
+    async def labels():
+        main.labels_from_success_codes("Tanu", sel)
+    return {"": labels}
+
+async def bench_recap(w: World, it: int):
+    ch = w.ticket_channel(filler=40)
+    async def scan():
+        await main.find_recap_message(ch)
+    async def store_hit():
+        await main.load_ticket(ch)
+    async def store_miss():
+        main.db().execute("DELETE FROM tickets WHERE channel_id = ?", (ch.id,))
+        await main.load_ticket(ch)
+    return {"history_scan": scan, "load_ticket_hit": store_hit, "load_ticket_rebuild": store_miss}
+
+async def bench_feedback_lookup(w: World, it: int):
+    others = [w.g.add_member(FakeUser(next_id())) for _ in range(20)]
+    w.feedback_message(w.passeur, w.client)
+    for k in range(500):
+        w.feedback_message(others[k % len(others)], w.client)
+    async def rebuild():
+        main.meta_set("feedback_checkpoint", 0)
+        await main.sync_feedback_history(w.g)
+    async def lookup():
+        mid = main.feedback_index_get(w.g.id, w.passeur.id)
+        await w.feedback.fetch_message(mid)
+    async def leaderboard():
+        main.passages_leaderboard(w.g.id, 0, 10)
+        main.passages_weekly(w.g.id, 8)
+    await rebuild()
+    return {"rebuild_500": rebuild, "lookup": lookup, "analytics_reports": leaderboard}
+
+async def bench_click_flow(w: World, it: int):
+    main.passeurs_maps[main.GUILD_ID] = main.MappingProxyType({"Tanu": main.parse_pool("Tanu", [w.passeur.id, w.owner.id])})
+    async def flow():
+        i = w.interaction(w.client)
+        await main.reservations.callback(i)
+        i = w.interaction(w.client)
+        await main.AreaView().handle_area(i, "Pandala")
+        sel = main.DonjonSelect("Pandala")
+        sel._values = ["Tanu"]
+        i = w.interaction(w.client)
+        await sel.callback(i)
+        v = i.view
+        for label in ("Succès : Oui", "Nomade", "Duo", "Suivant ➜", "✅ Dès que possible", "Valider la demande"):
+            v = await click_dynamic(main.WizardButton, v, label, w.interaction(w.client))
+        main.wizards.flush()
+    return {"": flow}
+
+async def bench_validate(w: World, it: int):
+    async def validate():
+        ch = w.ticket_channel()
+        btn = ch.add_message(w.me, "bouton")
+        i = w.interaction(w.passeur, "passage_validate_v1", channel=ch, message=btn)
+        await main.FeedbackPersistentView().validate.callback(i)
+    return {"": validate}
+
+async def bench_ack_watchdog(w: World, it: int):
+    budget, main.acks.budget = main.acks.budget, 0.005
+    async def restore():
+        main.acks.budget = budget
+    w.teardown.append(restore())
+    @main.acks.watch
+    async def slow(i):
+        await asyncio.sleep(0.02)  # handler qui dépasse le budget : defer auto puis followup
+        await main.rest.ack(i.response.send_message, "ok", ephemeral=True)
+    async def late():
+        await slow(w.interaction(w.client))
+    return {"slow_handler": late}
+
+async def bench_permissions(w: World, it: int):
+    pool = [w.g.add_member(FakeUser(next_id())) for _ in range(20)]
+    async def first_pass():
+        # Table entièrement nouvelle : une seule édition pour tout le pool
+        w.screens._ow = {}
+        main.passeurs_maps[main.GUILD_ID] = main.MappingProxyType({"Tanu": main.parse_pool("Tanu", [p.id for p in pool])})
+        await main.overwrites.reconcile_screen(w.g)
+    async def steady():
+        await main.overwrites.reconcile_screen(w.g)
+    return {"reconcile_20_passeurs": first_pass, "reconcile_noop": steady}
+
+async def bench_lifecycle(w: World, it: int):
+    async def archive():
+        ch = w.ticket_channel(filler=200)
+        main.ticket_put(ch.id, w.g.id, client_id=w.client.id, passeur_id=w.passeur.id, donjon="Tanu", succes="Aucun")
+        main.ticket_mark_validated(ch.id)
+        await main.sweep_tickets(w.g, delay=0)
+    return {"archive_200_messages": archive}
+
+async def bench_comment_path(w: World, it: int):
+    fbm = w.feedback_message(w.passeur, w.client)
+    main.feedback_edits.debounce = 0
+    async def burst():
+        for k in range(5):
+            author = (w.client, w.passeur)[k % 2]
+            m = w.feedback.add_message(author, f"commentaire {k}", reference=FakeReference(fbm.id))
+            await main.on_message(m)
+        await settle()
+        await main.feedback_edits.drain()
+    cdn = await FakeCDN().start()
+    w.teardown.append(cdn.stop())
+    async def screens(seeds):
+        main.feedback_index_put(w.g.id, w.passeur.id, fbm.id)
+        m = w.screens.add_message(w.passeur, "", attachments=[cdn.attachment(x) for x in seeds])
+        await main.on_message(m)
+        await settle()
+        await main.feedback_edits.drain()
+    async def screen():
+        await screens([next_id()])
+    async def batch():
+        await screens([next_id() for _ in range(4)])
+    reposted = [next_id() for _ in range(4)]
+    await screens(reposted)
+    async def repost():
+        # Mêmes images (nouvelles pièces jointes) : rien à ré-appliquer
+        await screens(reposted)
+    async def cold():
+        # Modèle évincé (ou redémarrage) : une lecture pour le reconstruire, puis l'édition
+        main.feedback_models.drop(fbm.id)
+        m = w.feedback.add_message(w.client, "commentaire", reference=FakeReference(fbm.id))
+        await main.on_message(m)
+        await settle()
+        await main.feedback_edits.drain()
+    noise_ch = w.g.add_text_channel(next_id(), "general")
+    async def noise():
+        await main.on_message(noise_ch.add_message(w.client, "salut"))
+    return {"reply_burst_5": burst, "reply_cold_model": cold, "screenshot": screen, "screenshot_batch_4": batch,
+            "screenshot_repost_4": repost, "irrelevant_message": noise}
+
+CASES = {
+    "next_ticket_name": (bench_next_ticket_name, 500),
+    "labels_from_success_codes": (bench_labels, 0),
+    "find_recap": (bench_recap, 0),
+    "feedback_lookup": (bench_feedback_lookup, 0),
+    "multistep_click_flow": (bench_click_flow, 0),
+    "validate": (bench_validate, 0),
+    "ack_watchdog": (bench_ack_watchdog, 0),
+    "permissions": (bench_permissions, 0),
+    "lifecycle": (bench_lifecycle, 0),
+    "on_message_comment": (bench_comment_path, 0),
+}
+
+async def run_all(args) -> dict:
+    results = {}
+    for name, (setup, n_channels) in CASES.items():
+        if args.only and not any(x in name for x in args.only):
+            continue
+        w = World(args.latency_ms / 1000, n_channels)
+        fns = await setup(w, args.iterations)
+        for sub, fn in fns.items():
+            key = f"{name}.{sub}" if sub else name
+            iterations = args.iterations
+            samples = []
+            before = w.rest.total()
+            for _ in range(iterations):
+                t0 = time.perf_counter()
+                await fn()
+                samples.append((time.perf_counter() - t0) * 1000)
+            results[key] = {
+                "iterations": iterations,
+                "mean_ms": round(sum(samples) / len(samples), 4),
+                "p50_ms": round(percentile(samples, 0.50), 4),
+                "p95_ms": round(percentile(samples, 0.95), 4),
+                "rest_calls_per_iter": round((w.rest.total() - before) / iterations, 2),
+            }
+            print(f"{key:45s} mean {results[key]['mean_ms']:9.3f} ms  p95 {results[key]['p95_ms']:9.3f} ms  "
+                  f"REST/iter {results[key]['rest_calls_per_iter']}")
+        for t in w.teardown:
+            await t
+    await main.screens.close()
+    return results
+
+def git_rev() -> str | None:
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, text=True).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def compare(old_path: str, new: dict):
+    old = json.loads(Path(old_path).read_text(encoding="utf-8"))["results"]
+    print(f"\nComparaison avec {old_path} (ratio mean nouveau / ancien) :")
+    for k, v in new.items():
+        if k in old and old[k]["mean_ms"]:
+            r = v["mean_ms"] / old[k]["mean_ms"]
+            flag = "  ⚠️ régression" if r > 1.2 else ""
+            print(f"  {k:45s} x{r:5.2f}{flag}")
+
+def main_cli():
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--iterations", type=int, default=50)
+    ap.add_argument("--latency-ms", type=float, default=0.0, help="latence simulée par appel REST")
+    ap.add_argument("--out", default="bench_results.json")
+    ap.add_argument("--compare", help="fichier de résultats précédent")
+    ap.add_argument("--only", nargs="*", help="filtre sur le nom des cas")
+    args = ap.parse_args()
+
+    results = asyncio.run(run_all(args))
+    payload = {
+        "meta": {
+            "git_rev": git_rev(),
+            "python": platform.python_version(),
+            "discord_py": discord.__version__,
+            "latency_ms": args.latency_ms,
+            "iterations": args.iterations,
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+        },
+        "results": results,
+    }
+    Path(args.out).write_text(json.dumps(payload, indent=2, ensure_ascii=False), encoding="utf-8")
+    print(f"\n→ {args.out}")
+    if args.compare:
+        compare(args.compare, results)
+
+if __name__ == "__main__":
+    main_cli()
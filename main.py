@@ -1,4 +1,8 @@
-import os, json, re, discord
+import os, sys, json, re, time, gzip, queue, sqlite3, asyncio, itertools, functools, logging, hashlib, heapq, contextlib, contextvars, aiohttp, discord
+import logging.handlers
+from types import MappingProxyType
+from collections import OrderedDict, Counter, deque
+from urllib.parse import urlsplit
 from pathlib import Path
 from discord.ext import commands
 from discord.ui import View, Button, Select
@@ -18,17 +22,154 @@ def env_int(name: str, fallback: int) -> int:
     except ValueError:
         raise RuntimeError(f"{name} doit être un nombre (int). Actuel: {v}")
 
-GUILD_ID = env_int("GUILD_ID", 1393982298654900345)
+def env_int_list(name: str) -> list[int]:
+    v = os.getenv(name) or ""
+    try:
+        return [int(x) for x in v.replace(" ", "").split(",") if x]
+    except ValueError:
+        raise RuntimeError(f"{name} doit être une liste d'ids séparés par des virgules. Actuel: {v}")
+
+GUILD_ID = env_int("GUILD_ID", 1393982298654900345)  # guilde principale : config par défaut issue de l'env
 DEMANDS_CHANNEL_ID = env_int("DEMANDS_CHANNEL_ID", 1393984437078720603)
 OWNER_ID = env_int("OWNER_ID", 342021125800198144)
 TICKET_PREFIX = os.getenv("TICKET_PREFIX", "ticket-passage-donjon")
 NEW_CATEGORY_ID = env_int("NEW_CATEGORY_ID", 1426346995466895480)
+OVERFLOW_CATEGORY_IDS = env_int_list("OVERFLOW_CATEGORY_IDS")  # catégories de débordement, dans l'ordre
+ARCHIVE_CATEGORY_ID = env_int("ARCHIVE_CATEGORY_ID", 0)  # 0 = les tickets clos sont supprimés
 FEEDBACK_CHANNEL_ID = env_int("FEEDBACK_CHANNEL_ID", 1394291299066056745)
 SCREEN_CHANNEL_ID = env_int("SCREEN_CHANNEL_ID", 1427079620246638732)
 WAKEUP_CHANNEL_ID = env_int("WAKEUP_CHANNEL_ID", 1426347294525096119)
 
 BASE_DIR = Path(__file__).resolve().parent
 PASSEURS_JSON_PATH = Path(os.getenv("PASSEURS_JSON_PATH", str(BASE_DIR / "passeurs.json")))
+DONJONS_JSON_PATH = Path(os.getenv("DONJONS_JSON_PATH", str(BASE_DIR / "donjons.json")))
+PASSEURS_POLL_SECONDS = env_int("PASSEURS_POLL_SECONDS", 10)
+SESSION_TTL_SECONDS = env_int("SESSION_TTL_SECONDS", 900)  # = timeout de MultiStepView / durée du token d'interaction
+SESSION_MAX_USERS = env_int("SESSION_MAX_USERS", 2000)
+SESSION_MAX_MESSAGES = env_int("SESSION_MAX_MESSAGES", 8)
+WIZARD_MAX_CACHED = env_int("WIZARD_MAX_CACHED", 500)  # sessions de réservation gardées en mémoire (le reste : store)
+WIZARD_FLUSH_MS = env_int("WIZARD_FLUSH_MS", 1000)  # write-behind du journal des sessions
+CLEANUP_CONCURRENCY = env_int("CLEANUP_CONCURRENCY", 3)
+FEEDBACK_EDIT_DEBOUNCE_MS = env_int("FEEDBACK_EDIT_DEBOUNCE_MS", 1500)
+FEEDBACK_CACHE_SIZE = env_int("FEEDBACK_CACHE_SIZE", 512)  # modèles de feedback gardés en mémoire (LRU)
+FEEDBACK_COMMENT_TAIL = env_int("FEEDBACK_COMMENT_TAIL", 8)  # commentaires affichés dans l'embed (fil complet : !fil)
+REST_CONCURRENCY = env_int("REST_CONCURRENCY", 4)
+ACK_BUDGET_MS = env_int("ACK_BUDGET_MS", 2200)  # Discord : ack sous 3 s, sinon « l'interaction a échoué »
+TICKET_CLOSE_DELAY = env_int("TICKET_CLOSE_DELAY", 3600)  # secondes entre validation et archivage
+TICKET_SWEEP_INTERVAL = env_int("TICKET_SWEEP_INTERVAL", 300)
+TICKET_SWEEP_BATCH = env_int("TICKET_SWEEP_BATCH", 20)
+TICKET_SWEEP_CONCURRENCY = env_int("TICKET_SWEEP_CONCURRENCY", 2)
+CATEGORY_CHANNEL_LIMIT = 50  # limite Discord par catégorie
+METRICS_WINDOW = env_int("METRICS_WINDOW", 2048)  # échantillons conservés par handler
+METRICS_PROM_PATH = os.getenv("METRICS_PROM_PATH")  # fichier Prometheus (format texte), optionnel
+METRICS_PROM_INTERVAL = env_int("METRICS_PROM_INTERVAL", 30)
+DATA_DIR = Path(os.getenv("DATA_DIR", str(BASE_DIR / "data")))
+DB_PATH = Path(os.getenv("DB_PATH", str(DATA_DIR / "bot.sqlite3")))
+TRANSCRIPTS_DIR = Path(os.getenv("TRANSCRIPTS_DIR", str(DATA_DIR / "transcripts")))
+BOT_SHARDED = os.getenv("BOT_SHARDED", "0") == "1"  # AutoShardedBot : gateway répartie sur plusieurs shards
+SHARD_COUNT = env_int("SHARD_COUNT", 0)  # 0 = nombre de shards recommandé par Discord
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO").upper()
+LOG_PATH = os.getenv("LOG_PATH")  # fichier JSON lines, sinon stderr
+LOG_SAMPLE_BURST = env_int("LOG_SAMPLE_BURST", 10)  # erreurs identiques écrites par fenêtre, le reste est compté
+LOG_SAMPLE_WINDOW = env_int("LOG_SAMPLE_WINDOW", 60)
+SCREENS_DIR = Path(os.getenv("SCREENS_DIR", str(DATA_DIR / "screens")))
+SCREEN_CACHE_MAX_MB = env_int("SCREEN_CACHE_MAX_MB", 256)  # cache local des screens, éviction LRU
+SCREEN_MAX_BYTES = env_int("SCREEN_MAX_BYTES", 25 * 1024 * 1024)  # au-delà : pas de téléchargement
+SCREEN_FETCH_CONCURRENCY = env_int("SCREEN_FETCH_CONCURRENCY", 4)
+FEEDBACK_GALLERY_MAX = 4  # Discord regroupe jusqu'à 4 embeds de même url en galerie
+
+# =========================
+# Logs : JSON lines, écriture hors de la boucle
+# =========================
+log = logging.getLogger("bot")
+log_ctx: contextvars.ContextVar[dict] = contextvars.ContextVar("log_ctx", default={})
+LOG_CTX_FIELDS = ("guild", "channel", "ticket", "user", "handler")
+
+def log_bind(**fields):
+    """Ajoute des champs au contexte courant jusqu'à la fin du handler instrumenté englobant."""
+    log_ctx.set({**log_ctx.get(), **fields})
+
+class ErrorAccounting(logging.Filter):
+    """
+    Compte les exceptions par (origine, type) et échantillonne les erreurs répétées :
+    LOG_SAMPLE_BURST écritures par fenêtre et par clé, les suivantes ne sont que comptées.
+    """
+    def __init__(self, burst: int, window: float):
+        super().__init__()
+        self.burst = burst
+        self.window = window
+        self.counts: Counter = Counter()
+        self.suppressed: Counter = Counter()
+        self._windows: dict[tuple, list] = {}  # clé -> [début de fenêtre, écrits, supprimés]
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if record.levelno < logging.WARNING:
+            return True
+        exc = record.exc_info[0].__name__ if record.exc_info and record.exc_info[0] else None
+        where = f"{record.name}:{record.funcName}"
+        if exc:
+            self.counts[(where, exc)] += 1
+        key = (where, exc or record.msg)
+        now = time.monotonic()
+        w = self._windows.get(key)
+        if w is None or now - w[0] >= self.window:
+            if w is not None and w[2]:
+                record.suppressed = w[2]  # report du nombre d'occurrences tues
+            if len(self._windows) > 1024:
+                self._windows.clear()
+            self._windows[key] = [now, 1, 0]
+            return True
+        if w[1] < self.burst:
+            w[1] += 1
+            return True
+        w[2] += 1
+        self.suppressed[where] += 1
+        return False
+
+class ContextQueueHandler(logging.handlers.QueueHandler):
+    """Capture le contexte dans le thread appelant ; le formatage se fait dans le thread d'écriture."""
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        record.ctx = log_ctx.get()
+        record.message = record.getMessage()
+        record.msg, record.args = record.message, None
+        return record
+
+class JsonFormatter(logging.Formatter):
+    def format(self, record: logging.LogRecord) -> str:
+        out = {
+            "ts": round(record.created, 3),
+            "level": record.levelname.lower(),
+            "logger": record.name,
+            "msg": record.getMessage(),
+        }
+        ctx = getattr(record, "ctx", None) or {}
+        out.update((k, ctx[k]) for k in LOG_CTX_FIELDS if ctx.get(k) is not None)
+        if getattr(record, "suppressed", 0):
+            out["suppressed"] = record.suppressed
+        if record.exc_info:
+            out["exc_type"] = record.exc_info[0].__name__
+            out["exc"] = self.formatException(record.exc_info)
+        return json.dumps(out, ensure_ascii=False, default=str)
+
+log_accounting = ErrorAccounting(LOG_SAMPLE_BURST, LOG_SAMPLE_WINDOW)
+log_listener: logging.handlers.QueueListener | None = None
+
+def setup_logging():
+    """Handlers non bloquants : file mémoire côté boucle, écriture par un thread dédié."""
+    global log_listener
+    out = logging.handlers.WatchedFileHandler(LOG_PATH, encoding="utf-8") if LOG_PATH else logging.StreamHandler(sys.stderr)
+    out.setFormatter(JsonFormatter())
+    qh = ContextQueueHandler(queue.SimpleQueue())
+    qh.addFilter(log_accounting)
+    root = logging.getLogger()
+    root.handlers[:] = [qh]
+    root.setLevel(LOG_LEVEL)
+    log_listener = logging.handlers.QueueListener(qh.queue, out)
+    log_listener.start()
+
+def log_task_exception(t: asyncio.Task):
+    if not t.cancelled() and t.exception() is not None:
+        log.error("Tâche de fond en échec : %s", t.get_coro().__qualname__, exc_info=t.exception())
 
 # =========================
 # Bot setup
@@ -38,61 +179,235 @@ intents.guilds = True
 intents.members = True
 intents.messages = True
 intents.message_content = True
-bot = commands.Bot(command_prefix="!", intents=intents)
-
-user_messages = {}
-dashboard_message = None
+COMMAND_PREFIX = "!"
+if BOT_SHARDED:
+    bot = commands.AutoShardedBot(command_prefix=COMMAND_PREFIX, intents=intents, shard_count=SHARD_COUNT or None)
+else:
+    bot = commands.Bot(command_prefix=COMMAND_PREFIX, intents=intents)
+
+ready_once = False
+background_tasks = set()
+
+def spawn(coro) -> asyncio.Task:
+    # Garde une référence forte sur les tâches de fond (sinon le GC peut les annuler)
+    t = asyncio.create_task(coro)
+    background_tasks.add(t)
+    t.add_done_callback(background_tasks.discard)
+    t.add_done_callback(log_task_exception)
+    return t
 
 # =========================
 # Data
 # =========================
-DONJON_SUCCES = {
-    "Obsidiantre": [("Premier","obsi_premier"),("Statue","obsi_statue"),("Duo","obsi_duo")],
-    "Tengu": [("Premier","tengu_premier"),("Statue","tengu_statue"),("Duo","tengu_duo")],
-    "Korriandre": [("Mystique","korriandre_mystique"),("Zombie","korriandre_zombie"),("Duo","korriandre_duo")],
-    "Kolosso": [("Dernier","kolosso_dernier"),("Premier","kolosso_premier"),("Duo","kolosso_duo")],
-    "Sakaii": [("Versatile","sakaii_versatile"),("Blitzkrieg","sakaii_blitzkrieg"),("Duo","sakaii_duo")],
-    "Glours": [("Premier","glours_premier"),("Collant","glours_collant"),("Duo","glours_duo")],
-    "Nagate": [("Dernier","nagate_dernier"),("Hardi","nagate_hardi"),("Duo","nagate_duo")],
-    "Tanu": [("Nomade","tanu_nomade"),("Blitzkrieg","tanu_blitz"),("Duo","tanu_duo")],
-    "Founo": [("Dernier","founo_dernier"),("Anachorète","founo_anachorete"),("Duo","founo_duo")],
-    "Dojo du vent": [("Premier","dojo_premier"),("Pusillanime","dojo_pusillamine"),("Duo","dojo_duo")],
-    "Damadrya": [("Anachorète","damadrya_anachorete"),("Premier","damadrya_premier"),("Duo","damadrya_duo")],
-    "Katamashii": [("Main propres","katamashii_main"),("Hardi","katamashii_hardi"),("Duo","katamashii_duo")],
-    "Kralamour": [("Nomade","kralamour_nomade"),("Blitzkrieg","kralamour_blitzkrieg"),("Duo","kralamour_duo")],
-    "Kimbo": [("Statue","kimbo_statue"),("Premier","kimbo_premier"),("Duo","kimbo_duo")]
-}
-
-DISABLED_SUCCES = {
-    "Dojo du vent": ["dojo_premier","dojo_duo"],
-    "Katamashii": ["katamashii_hardi","katamashii_duo"]
-}
+class Catalog:
+    """
+    Catalogue zones / donjons / succès compilé une fois au démarrage en index immuables :
+    les handlers d'interaction ne font plus que des lookups.
+    """
+    __slots__ = ("zones", "zone_custom_ids", "zone_dungeons", "code_label", "disabled", "select_options", "success_buttons")
+
+    def __init__(self, raw: dict):
+        zones, zone_ids, zone_dons, code_label, disabled, options, buttons = [], {}, {}, {}, set(), {}, {}
+        for z in raw.get("zones", []):
+            zname, dons = str(z["name"]), []
+            zone_ids[zname] = str(z.get("custom_id") or f"area_{zname}")
+            for d in z.get("donjons", []):
+                dname, specs = str(d["name"]), []
+                if dname in buttons:
+                    raise ValueError(f"donjon en double : {dname}")
+                for sx in d.get("succes", []):
+                    code, off = str(sx["code"]), bool(sx.get("disabled", False))
+                    code_label[(dname, code)] = str(sx["label"])
+                    if off:
+                        disabled.add((dname, code))
+                    specs.append(MappingProxyType({
+                        "code": code,
+                        "label": str(sx["label"]),
+                        "style": discord.ButtonStyle.danger if off else discord.ButtonStyle.secondary,
+                        "disabled": off,
+                    }))
+                if len(specs) > 24:
+                    raise ValueError(f"{dname} : 24 succès maximum (limite de composants Discord)")
+                buttons[dname] = tuple(specs)
+                dons.append(dname)
+            if not 0 < len(dons) <= 25:
+                raise ValueError(f"{zname} : entre 1 et 25 donjons (limite d'un menu Discord)")
+            zones.append(zname)
+            zone_dons[zname] = tuple(dons)
+            options[zname] = tuple(discord.SelectOption(label=x, value=x) for x in dons)
+        if not 0 < len(zones) <= 25:
+            raise ValueError("entre 1 et 25 zones")
+
+        self.zones = tuple(zones)
+        self.zone_custom_ids = MappingProxyType(zone_ids)
+        self.zone_dungeons = MappingProxyType(zone_dons)
+        self.code_label = MappingProxyType(code_label)
+        self.disabled = frozenset(disabled)
+        self.select_options = MappingProxyType(options)
+        self.success_buttons = MappingProxyType(buttons)
+
+def load_catalog(path: Path) -> Catalog:
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            return Catalog(json.load(f))
+    except (OSError, ValueError, KeyError, TypeError) as e:
+        raise RuntimeError(f"Catalogue des donjons invalide ({path}) : {e}")
+
+CATALOG = load_catalog(DONJONS_JSON_PATH)
 
 MENTION_ID_RE = re.compile(r"<@!?(\d+)>")
 
 # =========================
 # Helpers
 # =========================
-def load_passeurs_map():
+def parse_pool(donjon, v) -> tuple[tuple[int, float], ...]:
+    """
+    Pool de passeurs d'un donjon : `id`, `[id, ...]` ou `[{"id": id, "weight": 2}, ...]`.
+    Retourne ((id, poids), ...).
+    """
+    items = v if isinstance(v, list) else [v]
+    pool = []
+    for x in items:
+        try:
+            if isinstance(x, dict):
+                pid, w = int(x["id"]), float(x.get("weight", 1))
+            else:
+                pid, w = int(x), 1.0
+        except (KeyError, TypeError, ValueError):
+            raise ValueError(f"entrée invalide pour {donjon!r}: {x!r}")
+        if w <= 0:
+            raise ValueError(f"poids invalide pour {donjon!r}: {w}")
+        pool.append((pid, w))
+    if not pool:
+        raise ValueError(f"pool vide pour {donjon!r}")
+    return tuple(pool)
+
+def read_passeurs_file(path: Path) -> tuple[dict[str, tuple], float | None]:
+    """Lit et valide passeurs.json. Lève ValueError si le contenu est invalide."""
+    if not path.exists():
+        return {}, None
+    mtime = path.stat().st_mtime
+    with open(path, "r", encoding="utf-8") as f:
+        try:
+            raw = json.load(f)
+        except json.JSONDecodeError as e:
+            raise ValueError(f"JSON invalide ({e})")
+    if not isinstance(raw, dict):
+        raise ValueError("le fichier doit contenir un objet {donjon: passeur(s)}")
+    return {str(k): parse_pool(k, v) for k, v in raw.items()}, mtime
+
+def passeurs_file_mtime(path: Path) -> float | None:
+    try:
+        return path.stat().st_mtime
+    except FileNotFoundError:
+        return None
+
+# Tables de routage par guilde : chacune remplacée d'un bloc (swap atomique), jamais modifiée en place
+passeurs_maps: dict[int, MappingProxyType] = {}
+passeurs_mtimes: dict[int, float | None] = {}
+NO_PASSEURS = MappingProxyType({})
+
+def passeurs_for(guild_id: int) -> MappingProxyType:
+    return passeurs_maps.get(guild_id, NO_PASSEURS)
+
+async def reload_passeurs(cfg: "GuildConfig", force: bool = False) -> bool:
+    """
+    Recharge la table de la guilde si son fichier a changé (mtime), au premier passage, ou si force=True.
+    En cas de fichier invalide, l'ancienne table est conservée et ValueError est relevée.
+    """
+    gid = cfg.guild_id
+    if not force and gid in passeurs_mtimes and await asyncio.to_thread(passeurs_file_mtime, cfg.passeurs_path) == passeurs_mtimes[gid]:
+        return False
     try:
-        if not PASSEURS_JSON_PATH.exists():
-            return {}
-        with open(PASSEURS_JSON_PATH, "r", encoding="utf-8") as f:
-            return {str(k): int(v) for k,v in json.load(f).items()}
-    except:
-        return {}
-
-def get_passeur_for_donjon(d):
-    return load_passeurs_map().get(d, OWNER_ID)
-
-def next_ticket_name(cat, prefix):
-    n = []
+        m, mtime = await asyncio.to_thread(read_passeurs_file, cfg.passeurs_path)
+    except OSError as e:
+        raise ValueError(f"lecture impossible ({e})")
+    passeurs_maps[gid], passeurs_mtimes[gid] = MappingProxyType(m), mtime
+    return True
+
+async def watch_passeurs():
+    while not bot.is_closed():
+        for g, cfg in guild_configs.active():
+            try:
+                if await reload_passeurs(cfg):
+                    log.info("Passeurs de %s rechargés (%d donjons)", g.id, len(passeurs_for(g.id)))
+                    await reconcile_screen_access(g)
+            except ValueError as e:
+                log.warning("%s ignoré, table précédente conservée : %s", cfg.passeurs_path.name, e)
+        await asyncio.sleep(PASSEURS_POLL_SECONDS)
+
+# Charge : tickets ouverts par passeur, tenue à jour à la création / validation (amorcée depuis le store)
+open_load: Counter = Counter()
+unavailable_passeurs: set[tuple[int, int]] = set()  # (guild_id, passeur_id) : dispo propre à chaque guilde
+
+def get_passeur_for_donjon(cfg: "GuildConfig", d):
+    """Passeur disponible le moins chargé du pool (charge / poids) ; propriétaire de la guilde à défaut."""
+    best, best_score = cfg.owner_id, None
+    for pid, w in passeurs_for(cfg.guild_id).get(d, ()):
+        if (cfg.guild_id, pid) in unavailable_passeurs:
+            continue
+        score = (open_load[pid] + 1) / w
+        if best_score is None or score < best_score:
+            best, best_score = pid, score
+    return best
+
+def assign_passeur(cfg: "GuildConfig", d) -> int:
+    # Réservation immédiate (avant tout await) : deux créations simultanées ne voient pas la même charge
+    pid = get_passeur_for_donjon(cfg, d)
+    open_load[pid] += 1
+    return pid
+
+def release_passeur(pid):
+    if open_load[pid] > 0:
+        open_load[pid] -= 1
+
+def drop_open_ticket(channel_id):
+    # Ticket fermé sans validation (salon supprimé) : sa charge est rendue au passeur
+    pid = ticket_drop_open(channel_id)
+    if pid is not None:
+        release_passeur(pid)
+
+def prune_open_tickets(g: discord.Guild) -> int:
+    """Oublie les tickets ouverts dont le salon n'existe plus (supprimé pendant un arrêt)."""
+    gone = [cid for cid in open_ticket_channels(g.id) if g.get_channel(cid) is None]
+    for cid in gone:
+        drop_open_ticket(cid)
+    return len(gone)
+
+def load_passeur_state():
+    open_load.clear()
+    open_load.update(open_ticket_counts())
+    unavailable_passeurs.clear()
+    unavailable_passeurs.update(unavailable_passeur_ids())
+
+ticket_number_res: dict[str, re.Pattern] = {}
+ticket_seq_lock = asyncio.Lock()
+
+def ticket_number_re(prefix: str) -> re.Pattern:
+    r = ticket_number_res.get(prefix)
+    if r is None:
+        r = ticket_number_res[prefix] = re.compile(rf"^{re.escape(prefix)}-(\d+)$")
+    return r
+
+def max_ticket_number(cat, prefix) -> int:
+    # Uniquement pour amorcer la séquence au premier lancement
+    n = 0
     if cat:
+        r = ticket_number_re(prefix)
         for c in cat.text_channels:
-            m = re.match(rf"^{re.escape(prefix)}-(\d{{3}})$", c.name)
+            m = r.match(c.name)
             if m:
-                n.append(int(m.group(1)))
-    return f"{prefix}-{(max(n)+1) if n else 1:03d}"
+                n = max(n, int(m.group(1)))
+    return n
+
+async def next_ticket_name(guild_id, cat, prefix):
+    """
+    Séquence monotone persistée par (guilde, préfixe) : O(1), sans collision entre créations concurrentes.
+    Le numéro est sur 3 chiffres minimum et continue au-delà de 999.
+    """
+    async with ticket_seq_lock:
+        n = ticket_seq_next(guild_id, prefix, lambda: max_ticket_number(cat, prefix))
+    return f"{prefix}-{n:03d}"
 
 def make_summary_embed(u, a, d, s, disp):
     e = discord.Embed(title="Récapitulatif de la réservation", color=0x2F3136)
@@ -105,11 +420,7 @@ def make_summary_embed(u, a, d, s, disp):
     return e
 
 def labels_from_success_codes(d, sel):
-    labels = []
-    for cid in sel:
-        for lbl, cid2 in DONJON_SUCCES.get(d, []):
-            if cid2 == cid:
-                labels.append(lbl)
+    labels = [CATALOG.code_label[(d, c)] for c in sel if (d, c) in CATALOG.code_label]
     return ", ".join(labels) if labels else "Aucun"
 
 def extract_first_id_from_mention(text: str) -> int | None:
@@ -127,198 +438,1887 @@ def read_field(embed: discord.Embed, field_name: str) -> str | None:
             return f.value
     return None
 
-def update_or_add_comment_field(embed: discord.Embed, new_value: str) -> discord.Embed:
-    for idx, f in enumerate(embed.fields):
-        if f.name == "💬 Commentaires":
-            embed.set_field_at(idx, name="💬 Commentaires", value=new_value, inline=False)
-            return embed
-    embed.add_field(name="💬 Commentaires", value=new_value, inline=False)
-    return embed
-
 async def find_recap_message(channel: discord.TextChannel) -> discord.Message | None:
-    async for m in channel.history(limit=50, oldest_first=True):
+    for m in await rest.low(collect_history, channel, limit=50, oldest_first=True):
         if m.author == bot.user and m.embeds:
             emb = m.embeds[0]
             if emb.title and "Récapitulatif de la réservation" in emb.title:
                 return m
     return None
 
-async def find_latest_feedback_message_for_author(guild: discord.Guild, author_id: int) -> discord.Message | None:
-    fb = guild.get_channel(FEEDBACK_CHANNEL_ID)
-    if not isinstance(fb, discord.TextChannel):
+def parse_recap_message(recap_msg: discord.Message, owner_id: int) -> dict:
+    recap = recap_msg.embeds[0]
+    client_val = read_field(recap, "Client") or ""
+
+    # Client id
+    client_id = extract_first_id_from_mention(client_val)
+    if not client_id:
+        ids = extract_all_ids_from_text(recap_msg.content)
+        client_id = ids[0] if ids else None
+
+    # Passeur id (dans "client • <@pid>")
+    ids_in_text = extract_all_ids_from_text(recap_msg.content)
+    passeur_id = None
+    if client_id:
+        for x in ids_in_text:
+            if x != client_id:
+                passeur_id = x
+                break
+
+    return {
+        "client_id": client_id,
+        "client_val": client_val,
+        "passeur_id": passeur_id or owner_id,
+        "zone": read_field(recap, "Zone"),
+        "donjon": read_field(recap, "Donjon") or "Inconnu",
+        "succes": read_field(recap, "Succès demandés") or "Aucun",
+        "dispo": read_field(recap, "Disponibilité"),
+        "recap_message_id": recap_msg.id,
+    }
+
+async def load_ticket(channel: discord.TextChannel) -> sqlite3.Row | None:
+    """
+    Lecture O(1) dans le store local.
+    Le scan d'historique ne sert plus que de secours (store perdu / ticket antérieur).
+    """
+    t = ticket_get(channel.id)
+    if t:
+        return t
+    recap_msg = await find_recap_message(channel)
+    if not recap_msg or not recap_msg.embeds:
         return None
-    async for m in fb.history(limit=80):
-        if m.author != bot.user or not m.embeds:
-            continue
+    t = ticket_get(channel.id)
+    if t:
+        return t  # reconstruit entre-temps par un autre handler : ne pas compter sa charge deux fois
+    cfg = guild_configs.get(channel.guild.id)
+    ticket_put(channel.id, channel.guild.id, **parse_recap_message(recap_msg, cfg.owner_id if cfg else OWNER_ID))
+    t = ticket_get(channel.id)
+    # Ticket reconstruit ouvert (validated_at NULL) : sa charge est comptée, sinon la validation la rendrait à tort
+    open_load[t["passeur_id"]] += 1
+    return t
+
+def is_passage_message(m: discord.Message) -> bool:
+    """m est un embed « Passage effectué » posté par le bot."""
+    if m.author != bot.user or not m.embeds:
+        return False
+    e = m.embeds[0]
+    return bool(e.title and "Passage effectué" in e.title)
+
+def comment_label(author_id: int, owner_id: int, par_id: int | None, client_id: int | None) -> str:
+    if author_id == OWNER_ID:
+        return "🔴 Immo"
+    if author_id == owner_id:
+        return "🔴 Propriétaire"
+    if par_id and author_id == par_id:
+        return "👑 Passeur"
+    return "👤 Client"
+
+def passage_from_message(m: discord.Message) -> dict | None:
+    """Ligne analytique d'un embed « Passage effectué » (None si ce n'en est pas un)."""
+    if not is_passage_message(m):
+        return None
+    e = m.embeds[0]
+    return {
+        "message_id": m.id,
+        "guild_id": m.guild.id,
+        "passeur_id": extract_first_id_from_mention(read_field(e, "Par") or ""),
+        "client_id": extract_first_id_from_mention(read_field(e, "Pour") or ""),
+        "donjon": read_field(e, "Donjon") or "Inconnu",
+        "succes": read_field(e, "Succès demandés") or "Aucun",
+        "created_at": m.created_at.timestamp(),
+    }
+
+async def sync_feedback_history(guild: discord.Guild):
+    """
+    Scan incrémental du salon feedback (au démarrage) : ne lit que les messages postérieurs
+    au point de contrôle (tout l'historique au premier lancement) et alimente
+    l'index passeur -> dernier feedback ainsi que la table analytique des passages.
+    """
+    cfg = guild_configs.get(guild.id)
+    fb = guild.get_channel(cfg.feedback_channel_id) if cfg else None
+    if not isinstance(fb, discord.TextChannel):
+        return
+    key = guild_meta_key("feedback_checkpoint", guild.id)
+    last = meta_get(key)
+    after = discord.Object(id=int(last)) if last else None
+    while True:
+        batch = await rest.low(collect_history, fb, limit=100, after=after, oldest_first=True)
+        # Une transaction par page, point de contrôle compris : un arrêt en cours de scan ne refait que la page courante
+        with transaction():
+            for m in batch:
+                row = passage_from_message(m)
+                if row:
+                    if row["passeur_id"]:
+                        feedback_index_put(guild.id, row["passeur_id"], m.id)
+                    passage_put(**row)
+            if batch:
+                meta_set(key, batch[-1].id)
+        if len(batch) < 100:
+            break
+        after = batch[-1]
+
+# =========================
+# Store local (SQLite WAL)
+# =========================
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS tickets (
+    channel_id INTEGER PRIMARY KEY,
+    guild_id INTEGER NOT NULL,
+    client_id INTEGER,
+    client_val TEXT,
+    passeur_id INTEGER NOT NULL,
+    zone TEXT,
+    donjon TEXT NOT NULL,
+    succes TEXT NOT NULL,
+    dispo TEXT,
+    recap_message_id INTEGER,
+    created_at REAL NOT NULL,
+    validated_at REAL
+);
+CREATE TABLE IF NOT EXISTS feedback_index (
+    guild_id INTEGER NOT NULL,
+    passeur_id INTEGER NOT NULL,
+    message_id INTEGER NOT NULL,
+    PRIMARY KEY (guild_id, passeur_id)
+);
+CREATE TABLE IF NOT EXISTS ticket_seq (
+    guild_id INTEGER NOT NULL,
+    prefix TEXT NOT NULL,
+    value INTEGER NOT NULL,
+    PRIMARY KEY (guild_id, prefix)
+);
+CREATE TABLE IF NOT EXISTS passeur_status (
+    guild_id INTEGER NOT NULL,
+    passeur_id INTEGER NOT NULL,
+    available INTEGER NOT NULL,
+    PRIMARY KEY (guild_id, passeur_id)
+);
+CREATE TABLE IF NOT EXISTS passages (
+    message_id INTEGER PRIMARY KEY,
+    guild_id INTEGER NOT NULL,
+    passeur_id INTEGER,
+    client_id INTEGER,
+    donjon TEXT NOT NULL,
+    succes TEXT NOT NULL,
+    created_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS passages_guild_created_at ON passages (guild_id, created_at);
+CREATE TABLE IF NOT EXISTS wizard_sessions (
+    sid TEXT PRIMARY KEY,
+    user_id INTEGER NOT NULL,
+    zone TEXT NOT NULL,
+    donjon TEXT NOT NULL,
+    succes TEXT NOT NULL,
+    dispo TEXT,
+    stage TEXT NOT NULL,
+    updated_at REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS screen_hashes (
+    sha256 TEXT NOT NULL,
+    message_id INTEGER NOT NULL,
+    author_id INTEGER,
+    created_at REAL NOT NULL,
+    PRIMARY KEY (sha256, message_id)
+);
+CREATE TABLE IF NOT EXISTS comments (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    message_id INTEGER NOT NULL,
+    author_id INTEGER,
+    label TEXT NOT NULL,
+    text TEXT NOT NULL,
+    created_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS comments_message ON comments (message_id, id);
+CREATE TABLE IF NOT EXISTS guild_config (
+    guild_id INTEGER PRIMARY KEY,
+    data TEXT NOT NULL,
+    updated_at REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS meta (
+    key TEXT PRIMARY KEY,
+    value TEXT NOT NULL
+);
+"""
+
+SCHEMA_INDEX_RE = re.compile(r"^CREATE INDEX .*;$", re.M)
+
+_db: sqlite3.Connection | None = None
+
+def db() -> sqlite3.Connection:
+    global _db
+    if _db is None:
+        DB_PATH.parent.mkdir(parents=True, exist_ok=True)
+        _db = sqlite3.connect(DB_PATH, isolation_level=None, check_same_thread=False)
+        _db.row_factory = sqlite3.Row
+        _db.execute("PRAGMA journal_mode=WAL")
+        _db.execute("PRAGMA synchronous=NORMAL")
+        # Index créés après les migrations : ils peuvent porter sur une colonne ajoutée par celles-ci
+        _db.executescript(SCHEMA_INDEX_RE.sub("", SCHEMA))
+        ensure_column(_db, "tickets", "archived_at", "REAL")
+        ensure_guild_key(_db, "feedback_index")
+        ensure_guild_key(_db, "ticket_seq")
+        ensure_guild_key(_db, "passages")
+        ensure_guild_key(_db, "passeur_status")
+        _db.executescript("\n".join(SCHEMA_INDEX_RE.findall(SCHEMA)))
+    return _db
+
+@contextlib.contextmanager
+def transaction():
+    # Regroupe plusieurs écritures en un seul commit (la connexion est en autocommit)
+    c = db()
+    c.execute("BEGIN")
+    try:
+        yield c
+    except BaseException:
+        c.execute("ROLLBACK")
+        raise
+    c.execute("COMMIT")
+
+def ensure_column(conn: sqlite3.Connection, table: str, column: str, decl: str):
+    # Migration additive : les bases créées avant l'ajout de la colonne la reçoivent au démarrage
+    if column not in {r["name"] for r in conn.execute(f"PRAGMA table_info({table})")}:
+        conn.execute(f"ALTER TABLE {table} ADD COLUMN {column} {decl}")
+
+def ensure_guild_key(conn: sqlite3.Connection, table: str):
+    # Ajout de guild_id (clé ou filtre) : table recréée, les lignes existantes vont à la guilde principale
+    cols = [r["name"] for r in conn.execute(f"PRAGMA table_info({table})")]
+    if "guild_id" in cols:
+        return
+    ddl = re.search(rf"CREATE TABLE IF NOT EXISTS {table} \(.*?\n\);", SCHEMA, re.S).group(0)
+    names = ", ".join(cols)
+    conn.execute("BEGIN")
+    try:
+        conn.execute(f"ALTER TABLE {table} RENAME TO {table}_old")
+        conn.execute(ddl)
+        conn.execute(f"INSERT INTO {table} (guild_id, {names}) SELECT ?, {names} FROM {table}_old", (GUILD_ID,))
+        conn.execute(f"DROP TABLE {table}_old")  # emporte ses index : db() les recrée ensuite
+    except BaseException:
+        conn.execute("ROLLBACK")
+        raise
+    conn.execute("COMMIT")
+
+def ticket_put(channel_id, guild_id, client_id, passeur_id, donjon, succes,
+               zone=None, dispo=None, client_val=None, recap_message_id=None):
+    db().execute(
+        "INSERT OR REPLACE INTO tickets "
+        "(channel_id, guild_id, client_id, client_val, passeur_id, zone, donjon, succes, dispo, recap_message_id, created_at) "
+        "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+        (channel_id, guild_id, client_id, client_val, passeur_id, zone, donjon, succes, dispo, recap_message_id, time.time())
+    )
+
+def ticket_get(channel_id) -> sqlite3.Row | None:
+    return db().execute("SELECT * FROM tickets WHERE channel_id = ?", (channel_id,)).fetchone()
+
+def ticket_mark_validated(channel_id) -> bool:
+    """True si le ticket était encore ouvert."""
+    cur = db().execute(
+        "UPDATE tickets SET validated_at = ? WHERE channel_id = ? AND validated_at IS NULL",
+        (time.time(), channel_id)
+    )
+    return cur.rowcount > 0
+
+def tickets_to_archive(guild_id, validated_before: float, limit: int) -> list[sqlite3.Row]:
+    return db().execute(
+        "SELECT * FROM tickets WHERE guild_id = ? AND validated_at IS NOT NULL AND validated_at <= ? "
+        "AND archived_at IS NULL ORDER BY validated_at LIMIT ?",
+        (guild_id, validated_before, limit)
+    ).fetchall()
+
+def ticket_mark_archived(channel_id):
+    db().execute("UPDATE tickets SET archived_at = ? WHERE channel_id = ?", (time.time(), channel_id))
+
+def ticket_drop_open(channel_id) -> int | None:
+    """Supprime un ticket jamais validé ; renvoie son passeur (None si absent ou déjà validé)."""
+    with transaction() as c:
+        r = c.execute("SELECT passeur_id FROM tickets WHERE channel_id = ? AND validated_at IS NULL", (channel_id,)).fetchone()
+        if r:
+            c.execute("DELETE FROM tickets WHERE channel_id = ?", (channel_id,))
+    return r["passeur_id"] if r else None
+
+def open_ticket_channels(guild_id) -> list[int]:
+    return [r["channel_id"] for r in db().execute(
+        "SELECT channel_id FROM tickets WHERE guild_id = ? AND validated_at IS NULL", (guild_id,)
+    )]
+
+def open_ticket_counts() -> dict[int, int]:
+    rows = db().execute(
+        "SELECT passeur_id, COUNT(*) AS n FROM tickets WHERE validated_at IS NULL GROUP BY passeur_id"
+    ).fetchall()
+    return {r["passeur_id"]: r["n"] for r in rows}
+
+def set_passeur_available(guild_id, passeur_id, available: bool):
+    db().execute(
+        "INSERT OR REPLACE INTO passeur_status (guild_id, passeur_id, available) VALUES (?, ?, ?)",
+        (guild_id, passeur_id, int(available))
+    )
+
+def unavailable_passeur_ids() -> list[tuple[int, int]]:
+    return [(r["guild_id"], r["passeur_id"])
+            for r in db().execute("SELECT guild_id, passeur_id FROM passeur_status WHERE available = 0")]
+
+def ticket_seq_next(guild_id, prefix, seed) -> int:
+    r = db().execute("SELECT value FROM ticket_seq WHERE guild_id = ? AND prefix = ?", (guild_id, prefix)).fetchone()
+    n = (r["value"] if r else seed()) + 1
+    db().execute("INSERT OR REPLACE INTO ticket_seq (guild_id, prefix, value) VALUES (?, ?, ?)", (guild_id, prefix, n))
+    return n
+
+def wizard_row_get(sid) -> sqlite3.Row | None:
+    return db().execute("SELECT * FROM wizard_sessions WHERE sid = ?", (sid,)).fetchone()
+
+def wizard_rows_write(upserts: list[tuple], deletes: list[str], expired_before: float):
+    with transaction() as c:
+        c.executemany(
+            "INSERT OR REPLACE INTO wizard_sessions (sid, user_id, zone, donjon, succes, dispo, stage, updated_at) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+            upserts
+        )
+        c.executemany("DELETE FROM wizard_sessions WHERE sid = ?", [(x,) for x in deletes])
+        c.execute("DELETE FROM wizard_sessions WHERE updated_at < ?", (expired_before,))
+
+def guild_config_get(guild_id) -> dict | None:
+    r = db().execute("SELECT data FROM guild_config WHERE guild_id = ?", (guild_id,)).fetchone()
+    return json.loads(r["data"]) if r else None
+
+def guild_config_put(guild_id, data: dict):
+    db().execute(
+        "INSERT OR REPLACE INTO guild_config (guild_id, data, updated_at) VALUES (?, ?, ?)",
+        (guild_id, json.dumps(data), time.time())
+    )
+
+def guild_config_ids() -> list[int]:
+    return [r["guild_id"] for r in db().execute("SELECT guild_id FROM guild_config")]
+
+def guild_meta_key(key: str, guild_id) -> str:
+    # La guilde principale garde les clés historiques (pas de rescan après la migration multi-guilde)
+    return key if guild_id == GUILD_ID else f"{key}:{guild_id}"
+
+def meta_get(key, default=None):
+    r = db().execute("SELECT value FROM meta WHERE key = ?", (key,)).fetchone()
+    return r["value"] if r else default
+
+def meta_set(key, value):
+    db().execute("INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)", (key, str(value)))
+
+def feedback_index_put(guild_id, passeur_id, message_id):
+    # On ne garde que le plus récent par guilde (les snowflakes sont croissants)
+    db().execute(
+        "INSERT INTO feedback_index (guild_id, passeur_id, message_id) VALUES (?, ?, ?) "
+        "ON CONFLICT(guild_id, passeur_id) DO UPDATE SET message_id = excluded.message_id "
+        "WHERE excluded.message_id > feedback_index.message_id",
+        (guild_id, passeur_id, message_id)
+    )
+
+def passage_put(message_id, guild_id, passeur_id, client_id, donjon, succes, created_at):
+    db().execute(
+        "INSERT OR IGNORE INTO passages (message_id, guild_id, passeur_id, client_id, donjon, succes, created_at) "
+        "VALUES (?, ?, ?, ?, ?, ?, ?)",
+        (message_id, guild_id, passeur_id, client_id, donjon, succes, created_at)
+    )
+
+def passage_guild_id(message_id) -> int | None:
+    r = db().execute("SELECT guild_id FROM passages WHERE message_id = ?", (message_id,)).fetchone()
+    return r["guild_id"] if r else None
+
+def passages_leaderboard(guild_id, since: float, limit: int) -> list[sqlite3.Row]:
+    return db().execute(
+        "SELECT passeur_id, COUNT(*) AS n FROM passages WHERE guild_id = ? AND created_at >= ? "
+        "GROUP BY passeur_id ORDER BY n DESC LIMIT ?",
+        (guild_id, since, limit)
+    ).fetchall()
+
+def passages_weekly(guild_id, weeks: int) -> list[sqlite3.Row]:
+    return db().execute(
+        "SELECT strftime('%Y-S%W', created_at, 'unixepoch') AS week, COUNT(*) AS n FROM passages "
+        "WHERE guild_id = ? AND created_at >= ? GROUP BY week ORDER BY week DESC",
+        (guild_id, time.time() - weeks * 7 * 86400)
+    ).fetchall()
+
+def passages_by_donjon(guild_id, since: float) -> list[sqlite3.Row]:
+    return db().execute(
+        "SELECT donjon, succes, COUNT(*) AS n FROM passages WHERE guild_id = ? AND created_at >= ? "
+        "GROUP BY donjon, succes",
+        (guild_id, since)
+    ).fetchall()
+
+def feedback_index_get(guild_id, passeur_id) -> int | None:
+    r = db().execute(
+        "SELECT message_id FROM feedback_index WHERE guild_id = ? AND passeur_id = ?", (guild_id, passeur_id)
+    ).fetchone()
+    return r["message_id"] if r else None
+
+def feedback_index_drop(guild_id, passeur_id, message_id):
+    db().execute(
+        "DELETE FROM feedback_index WHERE guild_id = ? AND passeur_id = ? AND message_id = ?",
+        (guild_id, passeur_id, message_id)
+    )
+
+def comments_add(message_id, rows: list[tuple], created_at: float | None = None):
+    """rows : (author_id, label, text), dans l'ordre d'arrivée."""
+    ts = created_at or time.time()
+    with transaction() as c:
+        c.executemany(
+            "INSERT INTO comments (message_id, author_id, label, text, created_at) VALUES (?, ?, ?, ?, ?)",
+            [(message_id, a, lbl, txt, ts) for a, lbl, txt in rows]
+        )
+
+def comments_count(message_id) -> int:
+    return db().execute("SELECT COUNT(*) FROM comments WHERE message_id = ?", (message_id,)).fetchone()[0]
+
+def comments_page(message_id, offset: int, limit: int) -> list[sqlite3.Row]:
+    return db().execute(
+        "SELECT * FROM comments WHERE message_id = ? ORDER BY id LIMIT ? OFFSET ?",
+        (message_id, limit, offset)
+    ).fetchall()
+
+def comments_tail(message_id, n: int) -> list[sqlite3.Row]:
+    rows = db().execute(
+        "SELECT * FROM comments WHERE message_id = ? ORDER BY id DESC LIMIT ?", (message_id, n)
+    ).fetchall()
+    return rows[::-1]
+
+def screen_hashes_new(message_id, author_id, hashes: list[str]) -> set[str]:
+    """Enregistre les empreintes pour ce feedback ; renvoie celles qui n'y étaient pas encore."""
+    fresh = set()
+    now = time.time()
+    with transaction() as c:
+        for h in hashes:
+            cur = c.execute(
+                "INSERT OR IGNORE INTO screen_hashes (sha256, message_id, author_id, created_at) VALUES (?, ?, ?, ?)",
+                (h, message_id, author_id, now)
+            )
+            if cur.rowcount:
+                fresh.add(h)
+    return fresh
+
+# =========================
+# Configuration par guilde
+# =========================
+PASSEURS_DIR = DATA_DIR / "passeurs"
+
+def passeurs_file(raw) -> str:
+    # Saisie d'un propriétaire de guilde : confinée à DATA_DIR/passeurs (pas de lecture ailleurs sur l'hôte)
+    p = (PASSEURS_DIR / str(raw)).resolve()
+    if not p.is_relative_to(PASSEURS_DIR.resolve()) or p.suffix != ".json":
+        raise ValueError(f"fichier de passeurs attendu dans {PASSEURS_DIR} (ex. `<guild_id>.json`)")
+    return str(p)
+
+class GuildConfig:
+    """Salons, catégories, propriétaire et table de passeurs d'une guilde partenaire."""
+    __slots__ = ("guild_id", "owner_id", "demands_channel_id", "feedback_channel_id", "screen_channel_id",
+                 "wakeup_channel_id", "new_category_id", "overflow_category_ids", "archive_category_id",
+                 "ticket_prefix", "passeurs_path", "routes")
+
+    # clé -> conversion d'une valeur saisie (commande !config)
+    FIELDS = {
+        "owner_id": int,
+        "demands_channel_id": int,
+        "feedback_channel_id": int,
+        "screen_channel_id": int,
+        "wakeup_channel_id": int,
+        "new_category_id": int,
+        "overflow_category_ids": lambda v: [int(x) for x in str(v).replace(" ", "").split(",") if x],
+        "archive_category_id": int,
+        "ticket_prefix": str,
+        "passeurs_path": passeurs_file,
+    }
+    # clés réservées au propriétaire du bot (les tables de passeurs des partenaires partagent PASSEURS_DIR)
+    BOT_OWNER_FIELDS = {"passeurs_path"}
+
+    def __init__(self, guild_id: int, data: dict):
+        self.guild_id = guild_id
+        for k in self.FIELDS:
+            setattr(self, k, data[k])
+        self.overflow_category_ids = tuple(self.overflow_category_ids)
+        self.passeurs_path = Path(self.passeurs_path)
+        # Rôle des salons pour le routeur de messages
+        self.routes = {cid: kind for cid, kind in ((self.screen_channel_id, "screen"), (self.feedback_channel_id, "feedback")) if cid}
+
+    @staticmethod
+    def defaults(guild_id: int) -> dict:
+        if guild_id == GUILD_ID:
+            return {
+                "owner_id": OWNER_ID,
+                "demands_channel_id": DEMANDS_CHANNEL_ID,
+                "feedback_channel_id": FEEDBACK_CHANNEL_ID,
+                "screen_channel_id": SCREEN_CHANNEL_ID,
+                "wakeup_channel_id": WAKEUP_CHANNEL_ID,
+                "new_category_id": NEW_CATEGORY_ID,
+                "overflow_category_ids": OVERFLOW_CATEGORY_IDS,
+                "archive_category_id": ARCHIVE_CATEGORY_ID,
+                "ticket_prefix": TICKET_PREFIX,
+                "passeurs_path": str(PASSEURS_JSON_PATH),
+            }
+        return {
+            "owner_id": OWNER_ID,
+            "demands_channel_id": 0,
+            "feedback_channel_id": 0,
+            "screen_channel_id": 0,
+            "wakeup_channel_id": 0,
+            "new_category_id": 0,
+            "overflow_category_ids": [],
+            "archive_category_id": 0,
+            "ticket_prefix": TICKET_PREFIX,
+            "passeurs_path": str(PASSEURS_DIR / f"{guild_id}.json"),
+        }
+
+class GuildConfigStore:
+    """
+    Configurations chargées à la première rencontre d'une guilde puis gardées en mémoire
+    (absence comprise : une guilde non configurée ne coûte plus de requête SQL).
+    La guilde principale (GUILD_ID) est toujours active, avec l'env pour valeurs par défaut.
+    """
+    def __init__(self):
+        self._cache: dict[int, GuildConfig | None] = {}
+
+    def get(self, guild_id: int) -> GuildConfig | None:
+        try:
+            return self._cache[guild_id]
+        except KeyError:
+            pass
+        data = guild_config_get(guild_id)
+        if data is None and guild_id != GUILD_ID:
+            cfg = None
+        else:
+            cfg = GuildConfig(guild_id, {**GuildConfig.defaults(guild_id), **(data or {})})
+        self._cache[guild_id] = cfg
+        return cfg
+
+    def update(self, guild_id: int, key: str, raw) -> GuildConfig:
+        """Modifie une clé (ValueError si clé ou valeur invalide) ; active la guilde si besoin."""
+        conv = GuildConfig.FIELDS.get(key)
+        if conv is None:
+            raise ValueError(f"clé inconnue : {key}")
+        data = guild_config_get(guild_id) or {}
+        data[key] = conv(raw)
+        guild_config_put(guild_id, data)
+        self._cache.pop(guild_id, None)
+        return self.get(guild_id)
+
+    def active(self) -> list[tuple[discord.Guild, GuildConfig]]:
+        return [(g, cfg) for g in bot.guilds if (cfg := self.get(g.id)) is not None]
+
+    def ids(self) -> set[int]:
+        """Guildes configurées (sans passer par le cache gateway : utilisable avant la connexion)."""
+        return {GUILD_ID, *guild_config_ids()}
+
+guild_configs = GuildConfigStore()
+
+def is_owner(user_id: int, cfg: GuildConfig | None = None) -> bool:
+    # Propriétaire du bot partout ; propriétaire de la guilde chez lui
+    return user_id == OWNER_ID or (cfg is not None and user_id == cfg.owner_id)
+
+# =========================
+# Instrumentation
+# =========================
+class LatencyStats:
+    """Fenêtre glissante des METRICS_WINDOW dernières durées (ms) + totaux depuis le démarrage."""
+    __slots__ = ("samples", "count", "total")
+
+    def __init__(self):
+        self.samples = deque(maxlen=METRICS_WINDOW)
+        self.count = 0
+        self.total = 0.0
+
+    def add(self, ms: float):
+        self.samples.append(ms)
+        self.count += 1
+        self.total += ms
+
+    def quantiles(self, *qs: float) -> list[float]:
+        xs = sorted(self.samples)
+        if not xs:
+            return [0.0 for _ in qs]
+        return [xs[min(len(xs) - 1, int(q * len(xs)))] for q in qs]
+
+ROUTE_ID_RE = re.compile(r"/\d{15,}")
+
+class Metrics:
+    def __init__(self):
+        self.handlers: dict[str, LatencyStats] = {}
+        self.errors: Counter = Counter()
+        self.time_to_ack = LatencyStats()
+        self.ack_deferred: Counter = Counter()  # defers automatiques, par handler
+        self.ack_rerouted: Counter = Counter()  # réponses basculées en followup / edit_original_response
+        self.ack_defer_failed: Counter = Counter()  # defers automatiques refusés par Discord, par handler
+        self.ratelimit_waits: Counter = Counter()
+        self.ratelimit_wait_seconds = 0.0
+        self.ratelimit_global = 0  # parmi les attentes ci-dessus, celles dues à la limite globale
+        self.ratelimit_errors: Counter = Counter()  # 429 trop longs : RateLimited levée, pas d'attente
+
+    def observe(self, name: str, ms: float):
+        st = self.handlers.get(name)
+        if st is None:
+            st = self.handlers[name] = LatencyStats()
+        st.add(ms)
+
+    def observe_ack(self, interaction):
+        created = getattr(interaction, "created_at", None)
+        if created:
+            self.time_to_ack.add((discord.utils.utcnow() - created).total_seconds() * 1000)
+
+    def prometheus(self) -> str:
+        out = [
+            "# HELP bot_handler_latency_ms Durée des handlers (fenêtre glissante)",
+            "# TYPE bot_handler_latency_ms summary",
+        ]
+        for name, st in sorted(self.handlers.items()):
+            for q, v in zip((0.5, 0.95, 0.99), st.quantiles(0.5, 0.95, 0.99)):
+                out.append(f'bot_handler_latency_ms{{handler="{name}",quantile="{q}"}} {v:.3f}')
+            out.append(f'bot_handler_latency_ms_sum{{handler="{name}"}} {st.total:.3f}')
+            out.append(f'bot_handler_latency_ms_count{{handler="{name}"}} {st.count}')
+        out += ["# TYPE bot_handler_errors_total counter"]
+        out += [f'bot_handler_errors_total{{handler="{k}"}} {v}' for k, v in sorted(self.errors.items())]
+        out += ["# TYPE bot_interaction_ack_ms summary"]
+        for q, v in zip((0.5, 0.95, 0.99), self.time_to_ack.quantiles(0.5, 0.95, 0.99)):
+            out.append(f'bot_interaction_ack_ms{{quantile="{q}"}} {v:.3f}')
+        out.append(f"bot_interaction_ack_ms_count {self.time_to_ack.count}")
+        out += ["# TYPE bot_interaction_auto_defer_total counter"]
+        out += [f'bot_interaction_auto_defer_total{{handler="{k}"}} {v}' for k, v in sorted(self.ack_deferred.items())]
+        out += ["# TYPE bot_interaction_auto_defer_failed_total counter"]
+        out += [f'bot_interaction_auto_defer_failed_total{{handler="{k}"}} {v}' for k, v in sorted(self.ack_defer_failed.items())]
+        out += ["# TYPE bot_interaction_rerouted_total counter"]
+        out += [f'bot_interaction_rerouted_total{{method="{k}"}} {v}' for k, v in sorted(self.ack_rerouted.items())]
+        rm = rest.metrics()
+        out += ["# TYPE bot_rest_calls_total counter"]
+        out += [f'bot_rest_calls_total{{route="{k}"}} {v}' for k, v in sorted(rm["calls"].items())]
+        out += ["# TYPE bot_rest_queue_depth gauge"]
+        out += [f'bot_rest_queue_depth{{priority="{k}"}} {v}' for k, v in rm["queued"].items()]
+        out += ["# TYPE bot_rest_in_flight gauge", f"bot_rest_in_flight {rm['in_flight']}"]
+        out += ["# TYPE bot_rest_429_total counter"]
+        out += [f'bot_rest_429_total{{route="{k}"}} {v}' for k, v in sorted(self.ratelimit_waits.items())]
+        out += ["# TYPE bot_rest_429_wait_seconds_total counter", f"bot_rest_429_wait_seconds_total {self.ratelimit_wait_seconds:.3f}"]
+        out += ["# TYPE bot_rest_429_global_total counter", f"bot_rest_429_global_total {self.ratelimit_global}"]
+        out += ["# TYPE bot_rest_429_errors_total counter"]
+        out += [f'bot_rest_429_errors_total{{route="{k}"}} {v}' for k, v in sorted(self.ratelimit_errors.items())]
+        out += ["# TYPE bot_exceptions_total counter"]
+        out += [f'bot_exceptions_total{{where="{w}",type="{t}"}} {v}' for (w, t), v in sorted(log_accounting.counts.items())]
+        out += ["# TYPE bot_log_suppressed_total counter"]
+        out += [f'bot_log_suppressed_total{{where="{w}"}} {v}' for w, v in sorted(log_accounting.suppressed.items())]
+        return "\n".join(out) + "\n"
+
+metrics = Metrics()
+
+def event_fields(args) -> dict:
+    """guild / channel / user du premier message ou interaction parmi args."""
+    for x in args:
+        if hasattr(x, "channel") and hasattr(x, "guild"):
+            u = getattr(x, "user", None) or getattr(x, "author", None)
+            return {
+                "guild": getattr(x.guild, "id", None),
+                "channel": getattr(x.channel, "id", None),
+                "user": getattr(u, "id", None),
+            }
+    return {}
+
+def instrumented(name: str):
+    """Mesure la durée (et les erreurs) d'un handler async."""
+    def deco(fn):
+        @functools.wraps(fn)
+        async def wrapper(*args, **kwargs):
+            t0 = time.perf_counter()
+            token = log_ctx.set({**log_ctx.get(), "handler": name, **event_fields(args)})
+            try:
+                return await fn(*args, **kwargs)
+            except Exception:
+                metrics.errors[name] += 1
+                raise
+            finally:
+                log_ctx.reset(token)
+                metrics.observe(name, (time.perf_counter() - t0) * 1000)
+        return wrapper
+    return deco
+
+class RateLimitLogHandler(logging.Handler):
+    """
+    discord.py absorbe les 429 (attente + nouvel essai) et ne les signale que par un warning :
+    on compte ces warnings par route. Seul « Retrying in » correspond à une attente ; un 429 global
+    produit en plus « Global rate limit » pour la même attente (compté à part, sans secondes),
+    et « Timeout … erroring instead » lève RateLimited sans attendre.
+    """
+    def emit(self, record: logging.LogRecord):
+        msg = str(record.msg)
+        if msg.startswith("We are being rate limited") and len(record.args or ()) >= 3:
+            method, url, retry_after = record.args[:3]
+            route = f"{method} {ROUTE_ID_RE.sub('/{id}', urlsplit(str(url)).path)}"
+            if "Retrying in" in msg:
+                metrics.ratelimit_waits[route] += 1
+                metrics.ratelimit_wait_seconds += float(retry_after)
+            else:
+                metrics.ratelimit_errors[route] += 1
+        elif msg.startswith("Global rate limit"):
+            metrics.ratelimit_global += 1
+
+logging.getLogger("discord.http").addHandler(RateLimitLogHandler(logging.WARNING))
+
+def write_prometheus_file(path: str, text: str):
+    tmp = f"{path}.tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        f.write(text)
+    os.replace(tmp, path)
+
+async def export_metrics_loop():
+    while not bot.is_closed():
+        await asyncio.sleep(METRICS_PROM_INTERVAL)
+        try:
+            await asyncio.to_thread(write_prometheus_file, METRICS_PROM_PATH, metrics.prometheus())
+        except OSError:
+            log.warning("Export Prometheus impossible", exc_info=True)
+
+# =========================
+# REST sortant : ordonnanceur à priorités
+# =========================
+PRIO_ACK, PRIO_SEND, PRIO_LOW = 0, 1, 2
+PRIO_NAMES = ("ack", "send", "low")
+
+def rest_route(fn, args) -> tuple[str, str]:
+    """(route, bucket) : route = méthode appelée, bucket = route + ressource majeure (salon / guilde)."""
+    obj = getattr(fn, "__self__", None)
+    if obj is None:
+        route = fn.__name__
+        obj = args[0] if args else None
+    else:
+        route = f"{type(obj).__name__}.{fn.__name__}"
+    return route, f"{route}:{rest_major(obj)}"
+
+def rest_major(obj) -> str | int | None:
+    # Messages d'interaction et followups passent par le webhook de l'interaction (token) :
+    # un bucket par interaction, pas un par salon
+    st = getattr(obj, "_state", None)
+    inter = getattr(st, "_interaction", None)
+    if inter is not None:
+        return f"interaction:{inter.id}"
+    hook = obj if isinstance(obj, discord.Webhook) else getattr(st, "_webhook", None)
+    if hook is not None and hook.token:
+        return f"webhook:{hook.id}:{hash(hook.token)}"
+    return getattr(getattr(obj, "channel", None), "id", None) or getattr(obj, "id", None)
+
+async def collect_history(channel: discord.abc.Messageable, **kwargs) -> list[discord.Message]:
+    return [m async for m in channel.history(**kwargs)]
+
+class RestScheduler:
+    """
+    Point de passage unique des appels REST du bot.
+    - ack : réponses d'interaction (deadline 3 s), exécutées tout de suite, jamais mises en file ;
+    - send : messages visibles ; low : suppressions, éditions cosmétiques, scans d'historique.
+    send / low passent par une file à priorité, REST_CONCURRENCY appels simultanés,
+    et un seul appel en vol par bucket (évite les rafales qui déclenchent les 429).
+    Un worker ne prend jamais un appel dont le bucket est occupé : l'appel est mis de côté
+    et remis en file à la libération du bucket, le worker passe au suivant.
+    """
+    def __init__(self, concurrency: int):
+        self.concurrency = max(1, concurrency)
+        self._queue: asyncio.PriorityQueue | None = None
+        self._seq = itertools.count()
+        self._workers: list[asyncio.Task] = []
+        self._busy: set[str] = set()
+        self._parked: dict[str, list] = {}  # bucket -> tas (prio, seq, ...) en attente de ce bucket
+        self.queued = [0, 0, 0]
+        self.in_flight = 0
+        self.calls: Counter = Counter()
+
+    async def ack(self, fn, *args, **kwargs):
+        parent = getattr(getattr(fn, "__self__", None), "_parent", None)
+        w = acks.get(parent) if parent is not None else None
+        if w is None:
+            res = await self._run(fn, args, kwargs)
+        else:
+            # Sérialisé avec le defer automatique : l'un ou l'autre acquitte, jamais les deux
+            async with w.lock:
+                if w.deferred:
+                    return await self._run(acks.late(parent, fn), args, kwargs)
+                res = await self._run(fn, args, kwargs)
+        # Temps entre la création de l'interaction et son premier ack
+        if parent is not None:
+            metrics.observe_ack(parent)
+        return res
+
+    async def send(self, fn, *args, **kwargs):
+        return await self._enqueue(PRIO_SEND, fn, args, kwargs)
+
+    async def low(self, fn, *args, **kwargs):
+        return await self._enqueue(PRIO_LOW, fn, args, kwargs)
+
+    def metrics(self) -> dict:
+        return {
+            "queued": dict(zip(PRIO_NAMES, self.queued)),
+            "in_flight": self.in_flight,
+            "calls": dict(self.calls),
+        }
+
+    async def _enqueue(self, prio, fn, args, kwargs):
+        if self._queue is None:
+            self._queue = asyncio.PriorityQueue()
+            self._workers = [asyncio.create_task(self._worker()) for _ in range(self.concurrency)]
+        fut = asyncio.get_running_loop().create_future()
+        self.queued[prio] += 1
+        route, bucket = rest_route(fn, args)
+        self._queue.put_nowait((prio, next(self._seq), route, bucket, fn, args, kwargs, fut, False))
+        return await fut
+
+    async def _worker(self):
+        while True:
+            job = await self._queue.get()
+            prio, _, route, bucket, fn, args, kwargs, fut, reserved = job
+            if not reserved:
+                if bucket in self._busy:
+                    heapq.heappush(self._parked.setdefault(bucket, []), job)
+                    continue
+                self._busy.add(bucket)
+            self.queued[prio] -= 1
+            try:
+                if fut.cancelled():
+                    continue
+                self.calls[route] += 1
+                try:
+                    res = await self._call(fn, args, kwargs)
+                except Exception as e:
+                    if not fut.done():
+                        fut.set_exception(e)
+                else:
+                    if not fut.done():
+                        fut.set_result(res)
+            finally:
+                self._release(bucket)
+
+    def _release(self, bucket: str):
+        # Bucket libéré : le premier appel mis de côté repart en file en le gardant réservé
+        parked = self._parked.get(bucket)
+        if not parked:
+            self._busy.discard(bucket)
+            return
+        job = heapq.heappop(parked)
+        if not parked:
+            del self._parked[bucket]
+        self._queue.put_nowait(job[:-1] + (True,))
+
+    async def _run(self, fn, args, kwargs):
+        route, _ = rest_route(fn, args)
+        self.calls[route] += 1
+        return await self._call(fn, args, kwargs)
+
+    async def _call(self, fn, args, kwargs):
+        self.in_flight += 1
+        try:
+            return await fn(*args, **kwargs)
+        finally:
+            self.in_flight -= 1
+
+rest = RestScheduler(REST_CONCURRENCY)
+
+class AckWatch:
+    __slots__ = ("lock", "deferred", "timer")
+
+    def __init__(self):
+        self.lock = asyncio.Lock()
+        self.deferred = False
+        self.timer: asyncio.Task | None = None
+
+class AckWatchdog:
+    """
+    Garde la fenêtre d'ack des interactions pendant qu'un handler travaille.
+    Si le handler n'a pas répondu à l'approche de l'échéance, un defer part à sa place ;
+    ses réponses suivantes sont alors converties par rest.ack (followup / edit_original_response).
+    """
+    def __init__(self, budget: float):
+        self.budget = budget
+        self._watches: dict[int, AckWatch] = {}
+
+    def get(self, i) -> AckWatch | None:
+        return self._watches.get(i.id)
+
+    def watch(self, fn):
+        name = fn.__qualname__
+
+        @functools.wraps(fn)
+        async def wrapper(*args, **kwargs):
+            i = next((x for x in args if hasattr(x, "response") and hasattr(x, "followup")), None)
+            if i is None or i.id in self._watches:
+                return await fn(*args, **kwargs)
+            w = self._watches[i.id] = AckWatch()
+            w.timer = asyncio.create_task(self._deadline(i, w, name))
+            try:
+                return await fn(*args, **kwargs)
+            finally:
+                w.timer.cancel()
+                del self._watches[i.id]
+        return wrapper
+
+    async def _deadline(self, i, w: AckWatch, name: str):
+        elapsed = (discord.utils.utcnow() - i.created_at).total_seconds()
+        await asyncio.sleep(max(0.0, self.budget - elapsed))
+        async with w.lock:
+            if i.response.is_done():
+                return
+            try:
+                if getattr(i, "type", None) == discord.InteractionType.application_command:
+                    await i.response.defer(ephemeral=True, thinking=True)
+                else:
+                    await i.response.defer()
+            except discord.HTTPException as e:
+                # Interaction probablement expirée : le handler échouera à répondre, l'utilisateur voit une erreur
+                metrics.ack_defer_failed[name] += 1
+                log.warning("Defer automatique de %s refusé (interaction %s) : %s", name, i.id, e)
+                return
+            w.deferred = True
+        metrics.ack_deferred[name] += 1
+        metrics.observe_ack(i)
+
+    @staticmethod
+    def late(i, fn):
+        """Équivalent post-defer d'une méthode de i.response."""
+        metrics.ack_rerouted[fn.__name__] += 1
+        if fn.__name__ == "send_message":
+            return i.followup.send
+        if fn.__name__ == "edit_message":
+            return i.edit_original_response
+        async def noop(*args, **kwargs):
+            return None
+        return noop
+
+acks = AckWatchdog(ACK_BUDGET_MS / 1000)
+
+# =========================
+# Sessions éphémères (par utilisateur, TTL)
+# =========================
+class UserSession:
+    __slots__ = ("messages", "expires_at")
+
+    def __init__(self):
+        self.messages = []
+        self.expires_at = 0.0
+
+class SessionRegistry:
+    """
+    Messages éphémères du bot par utilisateur.
+    OrderedDict trié par dernière activité : l'expiration (TTL) et l'éviction (plafond) se font en tête.
+    """
+    def __init__(self, ttl: float, max_users: int, max_messages: int):
+        self.ttl = ttl
+        self.max_users = max_users
+        self.max_messages = max_messages
+        self._by_user: OrderedDict[int, UserSession] = OrderedDict()
+
+    def __len__(self):
+        return len(self._by_user)
+
+    def evict_expired(self, now: float | None = None):
+        now = time.monotonic() if now is None else now
+        while self._by_user:
+            uid, sess = next(iter(self._by_user.items()))
+            if sess.expires_at > now:
+                break
+            del self._by_user[uid]
+
+    def track(self, user_id: int, msg: discord.Message):
+        now = time.monotonic()
+        self.evict_expired(now)
+        sess = self._by_user.pop(user_id, None) or UserSession()
+        sess.messages.append(msg)
+        if len(sess.messages) > self.max_messages:
+            del sess.messages[:-self.max_messages]
+        sess.expires_at = now + self.ttl
+        self._by_user[user_id] = sess
+        while len(self._by_user) > self.max_users:
+            self._by_user.popitem(last=False)
+
+    def pop(self, user_id: int) -> list[discord.Message]:
+        self.evict_expired()
+        sess = self._by_user.pop(user_id, None)
+        return sess.messages if sess else []
+
+sessions = SessionRegistry(SESSION_TTL_SECONDS, SESSION_MAX_USERS, SESSION_MAX_MESSAGES)
+
+# =========================
+# Feedback : éditions groupées (debounce par message)
+# =========================
+class Screen:
+    """Image à afficher sur un feedback : empreinte (None si non téléchargée), URL d'origine, nom de fichier."""
+    __slots__ = ("sha256", "url", "filename")
+
+    def __init__(self, sha256: str | None, url: str, filename: str):
+        self.sha256 = sha256
+        self.url = url
+        self.filename = filename
+
+class FeedbackEdit:
+    """
+    Un ajout à un feedback. `images` peut être la tâche de téléchargement en cours :
+    l'édition prend sa place dans la file dès l'arrivée du message, les images la rejoignent ensuite.
+    """
+    __slots__ = ("author_id", "text", "images", "reply")
+
+    def __init__(self, author_id: int, text: str = "", images: "tuple[Screen, ...] | asyncio.Task" = (),
+                 reply: discord.Message | None = None):
+        self.author_id = author_id
+        self.text = text
+        self.images = images
+        self.reply = reply
+
+    async def screens(self) -> tuple[Screen, ...]:
+        if isinstance(self.images, asyncio.Task):
+            try:
+                self.images = await self.images
+            except Exception:
+                log.exception("Préparation des screens de %s en échec", self.author_id)
+                self.images = ()
+        return self.images
+
+COMMENTS_FIELD = "💬 Commentaires"
+NO_COMMENT = "*(Aucun commentaire pour le moment)*"
+
+class FeedbackModel:
+    """
+    Embed « Passage effectué » lu une seule fois, puis tenu à jour en mémoire :
+    l'embed est re-rendu depuis ce modèle, le fil complet des commentaires vit dans le store.
+    """
+    __slots__ = ("message_id", "par", "pour", "donjon", "succes", "dispo", "par_id", "client_id",
+                 "tail", "count", "images", "url", "attachments")
+
+    # nom du champ d'embed -> attribut
+    FIELDS = (("Par", "par"), ("Pour", "pour"), ("Donjon", "donjon"), ("Succès demandés", "succes"), ("Disponibilité", "dispo"))
+
+    def __init__(self, message_id, par, pour, donjon, succes, dispo, tail=(), count=0, images=(), url=None, attachments=()):
+        self.message_id = message_id
+        self.par, self.pour, self.donjon, self.succes, self.dispo = par, pour, donjon, succes, dispo
+        self.par_id = extract_first_id_from_mention(par)
+        self.client_id = extract_first_id_from_mention(pour)
+        self.tail = deque(tail, maxlen=FEEDBACK_COMMENT_TAIL)
+        self.count = count
+        self.images = list(images)
+        self.url = url
+        self.attachments = list(attachments)  # pièces jointes du feedback (screens ré-uploadés)
+
+    @classmethod
+    def from_message(cls, m: discord.Message) -> tuple["FeedbackModel", list[str]]:
+        """Modèle + lignes de commentaires déjà présentes dans l'embed (reprise de l'existant)."""
         e = m.embeds[0]
-        if not e.title or "Passage effectué" not in e.title:
-            continue
-        par_val = read_field(e, "Par") or ""
-        par_id = extract_first_id_from_mention(par_val)
-        if par_id == author_id:
-            return m
+        vals = {name: read_field(e, name) or "" for name, _ in cls.FIELDS}
+        current = read_field(e, COMMENTS_FIELD) or ""
+        lines = [x for x in current.split("\n") if x.strip() and not x.startswith("*(")]
+        images = [x.image.url for x in m.embeds if x.image and x.image.url]
+        model = cls(m.id, *(vals[name] for name, _ in cls.FIELDS), images=images, url=e.url, attachments=m.attachments)
+        return model, lines
+
+    def add_comments(self, lines: list[str]):
+        self.tail.extend(lines)
+        self.count += len(lines)
+
+    def add_images(self, urls: list[str], gallery_url: str):
+        # Galerie (embeds de même url) : les plus récentes s'ajoutent, les plus anciennes sortent au-delà du max
+        self.images = (self.images + urls)[-FEEDBACK_GALLERY_MAX:]
+        self.url = gallery_url
+
+    def kept_attachments(self) -> list[discord.Attachment]:
+        shown = {urlsplit(u).path for u in self.images}
+        return [a for a in self.attachments if urlsplit(a.url).path in shown]
+
+    def sync(self, m: discord.Message):
+        """Après une édition avec upload : URLs résolues (attachment://) et pièces jointes du message."""
+        self.images = [x.image.url for x in m.embeds if x.image and x.image.url]
+        self.attachments = list(m.attachments)
+
+    def comments_value(self) -> str:
+        lines = list(self.tail)
+        older = self.count - len(lines)
+        while True:
+            more = [f"*(+{older} plus ancien(s) : {COMMAND_PREFIX}fil {self.message_id})*"] if older > 0 else []
+            value = "\n".join(more + lines)
+            if len(value) <= 1024 or len(lines) <= 1:
+                return value[:1024] or NO_COMMENT
+            lines.pop(0)  # limite Discord d'un champ : on raccourcit l'aperçu, le fil reste complet
+            older += 1
+
+    def render(self) -> list[discord.Embed]:
+        e = discord.Embed(title="Passage effectué !", color=0x2ECC71, url=self.url if self.images else None)
+        for name, attr in self.FIELDS:
+            e.add_field(name=name, value=getattr(self, attr) or "Non précisé", inline=False)
+        e.add_field(name=COMMENTS_FIELD, value=self.comments_value(), inline=False)
+        if not self.images:
+            return [e]
+        e.set_image(url=self.images[0])
+        return [e, *(discord.Embed(url=self.url).set_image(url=u) for u in self.images[1:])]
+
+class FeedbackModelCache:
+    """Modèles par message id, LRU borné."""
+    def __init__(self, size: int):
+        self.size = size
+        self._models: OrderedDict[int, FeedbackModel] = OrderedDict()
+
+    def get(self, message_id: int) -> FeedbackModel | None:
+        model = self._models.get(message_id)
+        if model is not None:
+            self._models.move_to_end(message_id)
+        return model
+
+    def put(self, model: FeedbackModel):
+        self._models[model.message_id] = model
+        self._models.move_to_end(model.message_id)
+        while len(self._models) > self.size:
+            self._models.popitem(last=False)
+
+    def drop(self, message_id: int):
+        self._models.pop(message_id, None)
+
+feedback_models = FeedbackModelCache(FEEDBACK_CACHE_SIZE)
+
+def load_feedback_model(m: discord.Message) -> FeedbackModel:
+    """Parse l'embed ; au premier passage, ses commentaires affichés amorcent le fil du store."""
+    model, lines = FeedbackModel.from_message(m)
+    if lines and comments_count(m.id) == 0:
+        ts = (m.edited_at or m.created_at).timestamp() if m.created_at else None
+        comments_add(m.id, [(None, *split_comment_line(x)) for x in lines], ts)
+    model.count = comments_count(m.id)
+    model.tail.extend(f"{r['label']}: {r['text']}" for r in comments_tail(m.id, FEEDBACK_COMMENT_TAIL))
+    return model
+
+def split_comment_line(line: str) -> tuple[str, str]:
+    label, sep, text = line.partition(": ")
+    return (label, text) if sep else ("", line)
+
+class FeedbackEditCoalescer:
+    """
+    File d'éditions par message feedback, vidée en UNE édition après une courte fenêtre.
+    Un verrou par message garantit l'ordre : un flush suivant relit le message après le précédent.
+    """
+    def __init__(self, debounce: float):
+        self.debounce = debounce
+        self._pending: dict[int, list[FeedbackEdit]] = {}
+        self._channels: dict[int, discord.TextChannel] = {}
+        self._tasks: dict[int, asyncio.Task] = {}
+        self._locks: dict[int, asyncio.Lock] = {}
+        self._flushing: set[asyncio.Task] = set()
+
+    def submit(self, channel: discord.TextChannel, message_id: int, edit: FeedbackEdit):
+        self._pending.setdefault(message_id, []).append(edit)
+        self._channels[message_id] = channel
+        if message_id not in self._tasks:
+            self._tasks[message_id] = asyncio.create_task(self._flush_later(message_id))
+
+    async def drain(self):
+        """Attend la fin de tous les flushs programmés (arrêt propre, benchmarks)."""
+        while self._tasks or self._flushing:
+            await asyncio.gather(*self._tasks.values(), *self._flushing, return_exceptions=True)
+
+    async def _flush_later(self, message_id: int):
+        await asyncio.sleep(self.debounce)
+        lock = self._locks.setdefault(message_id, asyncio.Lock())
+        async with lock:
+            # À partir d'ici, un nouvel ajout programme un flush suivant (qui attendra ce verrou)
+            task = self._tasks.pop(message_id)
+            self._flushing.add(task)
+            edits = self._pending.pop(message_id, [])
+            ch = self._channels.pop(message_id)
+            try:
+                if edits:
+                    await self._apply(ch, message_id, edits)
+            except Exception:
+                log.exception("Flush des éditions du feedback %s en échec", message_id)
+            finally:
+                self._flushing.discard(task)
+        if message_id not in self._tasks:
+            self._locks.pop(message_id, None)
+
+    @staticmethod
+    def _stale(ch: discord.TextChannel, message_id: int, edits: list[FeedbackEdit]):
+        # Message supprimé : entrées d'index obsolètes (screens) et modèle à oublier
+        feedback_models.drop(message_id)
+        for x in edits:
+            if not x.reply:
+                feedback_index_drop(ch.guild.id, x.author_id, message_id)
+
+    @instrumented("feedback_flush")
+    async def _apply(self, ch: discord.TextChannel, message_id: int, edits: list[FeedbackEdit]):
+        # Téléchargements en cours terminés avant d'appliquer, dans l'ordre d'arrivée des messages
+        shots = [sc for x in edits for sc in await x.screens()]
+        if not shots and not any(x.text or x.reply for x in edits):
+            return  # screens déjà affichés : rien à éditer
+        model = feedback_models.get(message_id)
+        if model is None:
+            # Seul cas avec une lecture : premier commentaire depuis le démarrage (ou modèle évincé)
+            try:
+                fbm = await rest.low(ch.fetch_message, message_id)
+            except discord.NotFound:
+                return self._stale(ch, message_id, edits)
+            except discord.HTTPException:
+                log.warning("Lecture du feedback %s impossible", message_id, exc_info=True)
+                return
+            if not is_passage_message(fbm):
+                return
+            model = load_feedback_model(fbm)
+            feedback_models.put(model)
+
+        cfg = guild_configs.get(ch.guild.id)
+        owner_id = cfg.owner_id if cfg else OWNER_ID
+        rows = [(x.author_id, comment_label(x.author_id, owner_id, model.par_id, model.client_id), x.text)
+                for x in edits if x.text]
+        if rows:
+            # Le fil est enregistré avant l'édition : un échec Discord ne perd aucun commentaire
+            comments_add(message_id, rows)
+            model.add_comments([f"{lbl}: {txt}" for _, lbl, txt in rows])
+        kwargs, files, before = {}, [], model.images
+        if shots:
+            # Screens servis depuis le cache local : ré-uploadés sur le feedback, ils survivent
+            # à la suppression du message d'origine (réponses supprimées après application)
+            urls = []
+            for sc in shots[-FEEDBACK_GALLERY_MAX:]:
+                f = screens.file(sc, ch.guild.filesize_limit)
+                if f is not None:
+                    files.append(f)
+                    urls.append(f"attachment://{f.filename}")
+                else:
+                    urls.append(sc.url)
+            model.add_images(urls, ch.get_partial_message(message_id).jump_url)
+            for f in files:
+                if f"attachment://{f.filename}" not in model.images:
+                    f.close()
+            files = [f for f in files if f"attachment://{f.filename}" in model.images]
+            kwargs["attachments"] = [*model.kept_attachments(), *files]
+
+        try:
+            fbm = await rest.low(ch.get_partial_message(message_id).edit, embeds=model.render(), **kwargs)
+        except discord.NotFound:
+            return self._stale(ch, message_id, edits)
+        except discord.HTTPException:
+            model.images = before
+            log.warning("Édition du feedback %s impossible", message_id, exc_info=True)
+        else:
+            if shots:
+                model.sync(fbm)
+
+        replies = [x.reply for x in edits if x.reply]
+        if replies:
+            try:
+                await rest.low(ch.delete_messages, replies)
+            except discord.HTTPException:
+                log.warning("Suppression des réponses au feedback %s impossible", message_id, exc_info=True)
+
+feedback_edits = FeedbackEditCoalescer(FEEDBACK_EDIT_DEBOUNCE_MS / 1000)
+
+# =========================
+# Screens : téléchargement, empreinte, cache local
+# =========================
+class ScreenCache:
+    """
+    Screens téléchargés en parallèle (session HTTP partagée), rangés sous leur sha256.
+    Le cache sert les uploads vers le feedback (file()) ; il est borné : les fichiers les moins
+    récemment vus sont évincés.
+    """
+    def __init__(self, root: Path, max_bytes: int, concurrency: int):
+        self.root = root
+        self.max_bytes = max_bytes
+        self.size = 0
+        self._sem = asyncio.Semaphore(concurrency)
+        self._session: aiohttp.ClientSession | None = None
+        self._lru: OrderedDict[str, int] | None = None  # sha256 -> taille, du plus ancien au plus récent
+        self._by_url: OrderedDict[str, str] = OrderedDict()  # chemin CDN -> sha256 (même pièce jointe revue)
+
+    def session(self) -> aiohttp.ClientSession:
+        if self._session is None or self._session.closed:
+            self._session = aiohttp.ClientSession(timeout=aiohttp.ClientTimeout(total=30))
+        return self._session
+
+    async def close(self):
+        if self._session is not None:
+            await self._session.close()
+
+    def _index(self) -> OrderedDict[str, int]:
+        if self._lru is None:
+            self.root.mkdir(parents=True, exist_ok=True)
+            files = sorted(((p.stat(), p) for p in self.root.glob("*.img")), key=lambda x: x[0].st_mtime)
+            self._lru = OrderedDict((p.stem, st.st_size) for st, p in files)
+            self.size = sum(self._lru.values())
+        return self._lru
+
+    def _write(self, data: bytes) -> str:
+        h = hashlib.sha256(data).hexdigest()
+        path = self.root / f"{h}.img"
+        if path.exists():
+            os.utime(path)
+        else:
+            tmp = path.with_suffix(".tmp")
+            tmp.write_bytes(data)
+            os.replace(tmp, path)
+        return h
+
+    def _evict(self) -> list[Path]:
+        lru = self._index()
+        out = []
+        while self.size > self.max_bytes and len(lru) > 1:
+            h, n = lru.popitem(last=False)
+            self.size -= n
+            out.append(self.root / f"{h}.img")
+        return out
+
+    @instrumented("screen_fetch")
+    async def fetch(self, a: discord.Attachment) -> str | None:
+        """sha256 du contenu de la pièce jointe, ou None si elle n'a pas pu être téléchargée."""
+        lru = self._index()
+        key = urlsplit(a.url).path
+        h = self._by_url.get(key)
+        if h in lru:
+            lru.move_to_end(h)
+            return h
+        if a.size and a.size > SCREEN_MAX_BYTES:
+            return None
+        async with self._sem:
+            try:
+                async with self.session().get(a.url) as r:
+                    r.raise_for_status()
+                    data = await r.read()
+            except (aiohttp.ClientError, asyncio.TimeoutError):
+                log.warning("Téléchargement du screen %s impossible", a.url, exc_info=True)
+                return None
+        h = await asyncio.to_thread(self._write, data)
+        if h not in lru:
+            self.size += len(data)
+        lru[h] = len(data)
+        lru.move_to_end(h)
+        self._by_url[key] = h
+        while len(self._by_url) > 4 * len(lru) + 64:
+            self._by_url.popitem(last=False)
+        victims = self._evict()
+        if victims:
+            await asyncio.to_thread(lambda: [p.unlink(missing_ok=True) for p in victims])
+        return h
+
+    def file(self, sc: Screen, limit: int) -> discord.File | None:
+        """Fichier à uploader depuis le cache, ou None (non téléchargé, évincé, trop gros pour la guilde)."""
+        n = self._index().get(sc.sha256) if sc.sha256 else None
+        if n is None or n > limit:
+            return None
+        try:
+            f = discord.File(self.root / f"{sc.sha256}.img", filename=sc.filename)
+        except FileNotFoundError:
+            return None
+        self._lru.move_to_end(sc.sha256)
+        return f
+
+screens = ScreenCache(SCREENS_DIR, SCREEN_CACHE_MAX_MB * 1024 * 1024, SCREEN_FETCH_CONCURRENCY)
+
+def screen_filename(h: str, a: discord.Attachment) -> str:
+    ext = Path(a.filename or "").suffix.lower()
+    return f"{h[:16]}{ext if ext in ('.png', '.jpg', '.jpeg', '.gif', '.webp') else '.png'}"
+
+async def new_screens(m: discord.Message, message_id: int) -> tuple[Screen, ...]:
+    """
+    Images de m jamais appliquées à ce feedback (empreinte du contenu).
+    Téléchargements en parallèle ; une image illisible est gardée sans déduplication (URL d'origine).
+    """
+    imgs = [a for a in m.attachments if "image" in (a.content_type or "")]
+    if not imgs:
+        return ()
+    hashes = await asyncio.gather(*(screens.fetch(a) for a in imgs))
+    fresh = screen_hashes_new(message_id, m.author.id, [h for h in hashes if h])
+    out = []
+    for a, h in zip(imgs, hashes):
+        if h is None:
+            out.append(Screen(None, a.url, a.filename))
+        elif h in fresh:
+            fresh.discard(h)  # doublon dans le même message
+            out.append(Screen(h, a.url, screen_filename(h, a)))
+    return tuple(out)
+
+# =========================
+# Cycle de vie des tickets : débordement, transcription, archivage
+# =========================
+class CategorySlots:
+    """
+    Places des catégories de tickets prises mais pas encore visibles dans le cache gateway
+    (mis à jour à l'arrivée de CHANNEL_CREATE seulement) : créations en cours, puis salons
+    créés récemment, oubliés dès qu'ils apparaissent dans le cache (ou après `ttl` s).
+    """
+    def __init__(self, ttl: float):
+        self.ttl = ttl
+        self._inflight: Counter = Counter()
+        self._recent: dict[int, dict[int, float]] = {}  # catégorie -> {salon: instant de création}
+
+    def used(self, cat) -> int:
+        ids = {c.id for c in cat.channels}
+        recent = self._recent.get(cat.id)
+        if recent:
+            now = time.monotonic()
+            for cid in [cid for cid, t in recent.items() if cid in ids or t + self.ttl < now]:
+                del recent[cid]
+        return len(ids) + len(recent or ()) + self._inflight[cat.id]
+
+    def reserve(self, cat):
+        self._inflight[cat.id] += 1
+
+    def done(self, cat, channel_id: int | None):
+        self._inflight[cat.id] -= 1
+        if self._inflight[cat.id] <= 0:
+            del self._inflight[cat.id]
+        if channel_id is not None:
+            self._recent.setdefault(cat.id, {})[channel_id] = time.monotonic()
+
+category_slots = CategorySlots(60)
+
+def pick_ticket_category(g: discord.Guild, cfg: GuildConfig):
+    """
+    Première catégorie (principale puis débordement) qui a encore de la place, réservée
+    (sans await entre le choix et la réservation : deux créations simultanées ne prennent pas la même place).
+    La réservation est rendue par category_slots.done() une fois la création terminée.
+    """
+    for cid in [cfg.new_category_id, *cfg.overflow_category_ids]:
+        cat = g.get_channel(cid)
+        if cat is not None and category_slots.used(cat) < CATEGORY_CHANNEL_LIMIT:
+            category_slots.reserve(cat)
+            return cat
+    log.warning("Toutes les catégories de tickets sont pleines : ticket créé hors catégorie")
     return None
 
+def message_record(m: discord.Message) -> dict:
+    return {
+        "id": m.id,
+        "author_id": m.author.id,
+        "author": str(m.author),
+        "created_at": m.created_at.isoformat() if m.created_at else None,
+        "content": m.content,
+        "embeds": [e.to_dict() for e in m.embeds],
+        "attachments": [a.url for a in m.attachments],
+    }
+
+def append_transcript(path: Path, records: list[dict]):
+    # Chaque page est un membre gzip ajouté au fichier : lecture en flux, mémoire bornée à une page
+    path.parent.mkdir(parents=True, exist_ok=True)
+    with gzip.open(path, "at", encoding="utf-8") as f:
+        for r in records:
+            f.write(json.dumps(r, ensure_ascii=False) + "\n")
+
+async def write_transcript(ch: discord.TextChannel) -> Path:
+    path = TRANSCRIPTS_DIR / f"{ch.id}.jsonl.gz"
+    tmp = path.with_suffix(".tmp")
+    tmp.unlink(missing_ok=True)
+    after = None
+    while True:
+        batch = await rest.low(collect_history, ch, limit=100, after=after, oldest_first=True)
+        if batch:
+            await asyncio.to_thread(append_transcript, tmp, [message_record(m) for m in batch])
+        if len(batch) < 100:
+            break
+        after = batch[-1]
+    if tmp.exists():
+        os.replace(tmp, path)
+    return path
+
+async def archive_ticket(g: discord.Guild, cfg: GuildConfig, t: sqlite3.Row):
+    ch = g.get_channel(t["channel_id"])
+    if isinstance(ch, discord.TextChannel):
+        await write_transcript(ch)
+        arch = g.get_channel(cfg.archive_category_id) if cfg.archive_category_id else None
+        if arch is not None and len(arch.channels) < CATEGORY_CHANNEL_LIMIT:
+            await rest.low(ch.edit, category=arch, sync_permissions=True)
+        else:
+            await rest.low(ch.delete, reason="Ticket validé : archivé en transcription")
+    ticket_mark_archived(t["channel_id"])
+
+@instrumented("sweep_tickets")
+async def sweep_tickets(g: discord.Guild, delay: float = TICKET_CLOSE_DELAY) -> int:
+    """Archive les tickets validés depuis plus de `delay` s, par lots, avec une concurrence bornée."""
+    cfg = guild_configs.get(g.id)
+    if cfg is None:
+        return 0
+    sem = asyncio.Semaphore(TICKET_SWEEP_CONCURRENCY)
+    done = 0
+
+    async def one(t):
+        nonlocal done
+        async with sem:
+            log_bind(ticket=t["channel_id"])
+            try:
+                await archive_ticket(g, cfg, t)
+                done += 1
+            except (discord.HTTPException, OSError):
+                # OSError : transcription non écrite (disque plein, lecture seule) ; le ticket reste à archiver
+                log.warning("Archivage du ticket %s impossible", t["channel_id"], exc_info=True)
+            except Exception:
+                log.exception("Archivage du ticket %s en échec", t["channel_id"])
+
+    while True:
+        batch = tickets_to_archive(g.id, time.time() - delay, TICKET_SWEEP_BATCH)
+        if not batch:
+            return done
+        before = done
+        await asyncio.gather(*(one(t) for t in batch))
+        if done == before:
+            return done  # lot entièrement en échec : on réessaiera au prochain passage
+
+async def ticket_sweeper():
+    while not bot.is_closed():
+        for g, _ in guild_configs.active():
+            # Une erreur imprévue ne doit jamais arrêter la boucle (plus aucun ticket archivé sinon)
+            try:
+                await sweep_tickets(g)
+            except Exception:
+                log.exception("Passage d'archivage de la guilde %s en échec", g.id)
+        await asyncio.sleep(TICKET_SWEEP_INTERVAL)
+
+# =========================
+# Permissions : overwrites calculés une fois, appliqués par différence
+# =========================
+ALLOW_CHAT = discord.PermissionOverwrite(view_channel=True, send_messages=True)
+DENY_VIEW = discord.PermissionOverwrite(view_channel=False)
+
+class OverwriteReconciler:
+    """
+    - salon screens : accès accordé à tous les passeurs de la table (et au propriétaire, repli du routage)
+      en UNE édition, uniquement pour ceux à qui il manque ; l'état courant est lu dans le cache gateway ;
+    - tickets : overwrites de base (everyone / bot / propriétaire) construits une fois par guilde,
+      la création d'un ticket n'y ajoute que client et passeur, dans le payload de création.
+    """
+    def __init__(self):
+        self._ticket_base: dict[int, dict] = {}
+        self._lock = asyncio.Lock()
+
+    def ticket_overwrites(self, g: discord.Guild, cfg: GuildConfig, *members) -> dict:
+        base = self._ticket_base.get(g.id)
+        if base is None:
+            base = {g.default_role: DENY_VIEW, g.me: ALLOW_CHAT}
+            owner = g.get_member(cfg.owner_id)
+            if owner:
+                base[owner] = ALLOW_CHAT
+                self._ticket_base[g.id] = base  # propriétaire absent du cache : on réessaiera
+        ow = dict(base)
+        ids = {t.id for t in base}
+        for x in members:
+            if x and x.id not in ids:
+                ow[x] = ALLOW_CHAT
+                ids.add(x.id)
+        return ow
+
+    def invalidate(self, guild_id: int):
+        self._ticket_base.pop(guild_id, None)
+
+    @staticmethod
+    def screen_targets(cfg: GuildConfig) -> set[int]:
+        return {pid for pool in passeurs_for(cfg.guild_id).values() for pid, _ in pool} | {cfg.owner_id}
+
+    @instrumented("reconcile_screen")
+    async def reconcile_screen(self, g: discord.Guild) -> int:
+        """Accorde l'accès au salon screens aux passeurs qui ne l'ont pas ; renvoie le nombre d'ajouts."""
+        cfg = guild_configs.get(g.id)
+        sc = g.get_channel(cfg.screen_channel_id) if cfg else None
+        if not isinstance(sc, discord.TextChannel):
+            return 0
+        async with self._lock:
+            desired = {t.id: (t, ow) for t, ow in sc.overwrites.items()}
+            added = 0
+            for pid in self.screen_targets(cfg):
+                t, ow = desired.get(pid, (None, None))
+                if ow is not None and ow.view_channel and ow.send_messages:
+                    continue
+                m = t or g.get_member(pid)
+                if m is None:
+                    continue
+                # On complète l'overwrite existant sans toucher à ses autres permissions
+                new = discord.PermissionOverwrite(**dict(ow)) if ow is not None else discord.PermissionOverwrite()
+                new.update(view_channel=True, send_messages=True)
+                desired[pid] = (m, new)
+                added += 1
+            if added:
+                await rest.low(sc.edit, overwrites=dict(desired.values()), reason="Accès screens des passeurs")
+                log.info("Accès au salon screens accordé à %d passeur(s)", added)
+            return added
+
+overwrites = OverwriteReconciler()
+
+async def reconcile_screen_access(*guilds: discord.Guild):
+    """Réconcilie les guildes données (toutes les guildes configurées par défaut)."""
+    for g in guilds or [g for g, _ in guild_configs.active()]:
+        try:
+            await overwrites.reconcile_screen(g)
+        except discord.HTTPException:
+            log.warning("Réconciliation des accès screens de %s impossible", g.id, exc_info=True)
+
+# =========================
+# Réservation : état des sessions (journal write-behind)
+# =========================
+DISPO_LABELS = {"now": "Passage dès que possible", "later": "Passage à planifier"}
+
+class WizardState:
+    __slots__ = ("sid", "user_id", "a", "d", "s", "dispo", "stage", "updated_at")
+
+    def __init__(self, sid, user_id, a, d, s=None, dispo=None, stage="ask", updated_at=0.0):
+        self.sid = sid
+        self.user_id = user_id
+        self.a = a
+        self.d = d
+        self.s = s or []
+        self.dispo = dispo  # "now" / "later" / None
+        self.stage = stage  # "ask" -> "sel" | "skip" -> "disp"
+        self.updated_at = updated_at
+
+    def row(self) -> tuple:
+        return (self.sid, self.user_id, self.a, self.d, ",".join(self.s), self.dispo, self.stage, self.updated_at)
+
+    @classmethod
+    def from_row(cls, r: sqlite3.Row) -> "WizardState":
+        return cls(r["sid"], r["user_id"], r["zone"], r["donjon"], [x for x in r["succes"].split(",") if x],
+                   r["dispo"], r["stage"], r["updated_at"])
+
+class WizardStore:
+    """
+    Sessions de réservation : cache mémoire borné (LRU) devant le store SQLite.
+    Les écritures sont journalisées et vidées par lots (write-behind) ;
+    après un redémarrage, une session est rechargée à son premier clic.
+    """
+    def __init__(self, ttl: float, max_cached: int):
+        self.ttl = ttl
+        self.max_cached = max_cached
+        self._cache: OrderedDict[str, WizardState] = OrderedDict()
+        self._dirty: dict[str, WizardState | None] = {}
+
+    def new(self, sid: str, user_id: int, a: str, d: str) -> WizardState:
+        st = WizardState(sid, user_id, a, d)
+        self.touch(st)
+        return st
+
+    def get(self, sid: str) -> WizardState | None:
+        st = self._cache.get(sid)
+        if st is None:
+            if sid in self._dirty:
+                # Évincée du cache mais pas encore écrite : le journal fait foi (None = supprimée)
+                st = self._dirty[sid]
+            else:
+                r = wizard_row_get(sid)
+                st = WizardState.from_row(r) if r else None
+        if st is None or st.updated_at + self.ttl < time.time():
+            return None
+        return st
+
+    def touch(self, st: WizardState):
+        st.updated_at = time.time()
+        self._cache.pop(st.sid, None)
+        self._cache[st.sid] = st
+        while len(self._cache) > self.max_cached:
+            self._cache.popitem(last=False)
+        self._dirty[st.sid] = st
+
+    def drop(self, sid: str):
+        self._cache.pop(sid, None)
+        self._dirty[sid] = None
+
+    def flush(self):
+        now = time.time()
+        while self._cache:
+            sid, st = next(iter(self._cache.items()))
+            if st.updated_at + self.ttl >= now:
+                break
+            del self._cache[sid]
+        dirty, self._dirty = self._dirty, {}
+        wizard_rows_write(
+            [st.row() for st in dirty.values() if st is not None],
+            [sid for sid, st in dirty.items() if st is None],
+            now - self.ttl
+        )
+
+    async def run(self, interval: float):
+        while not bot.is_closed():
+            await asyncio.sleep(interval)
+            self.flush()
+
+wizards = WizardStore(SESSION_TTL_SECONDS, WIZARD_MAX_CACHED)
+
 # =========================
 # UI: Select / Views
 # =========================
 class DonjonSelect(Select):
-    def __init__(self, l, a):
+    def __init__(self, a):
         super().__init__(
             placeholder="Choisissez un donjon...",
-            options=[discord.SelectOption(label=x, value=x) for x in l]
+            options=list(CATALOG.select_options[a])
         )
         self.a = a
 
+    @instrumented("donjon_select")
+    @acks.watch
     async def callback(self, i: discord.Interaction):
         c = self.values[0]
-        v = MultiStepView(self.a, c)
-        await i.response.send_message(
+        st = wizards.new(base36(i.id), i.user.id, self.a, c)
+        view = MultiStepView(st)
+        await rest.ack(
+            i.response.send_message,
             embed=discord.Embed(
                 title=f"{self.a} — {c}",
                 description="Commencez par choisir si vous voulez faire les succès.",
                 color=0x2F3136
             ),
-            view=v,
+            view=view,
             ephemeral=True
         )
-        user_messages.setdefault(i.user.id, []).append(await i.original_response())
+        view.stop()
+        sessions.track(i.user.id, await rest.low(i.original_response))
+
+def base36(n: int) -> str:
+    out = ""
+    while True:
+        n, r = divmod(n, 36)
+        out = "0123456789abcdefghijklmnopqrstuvwxyz"[r] + out
+        if not n:
+            return out
+
+class WizardButton(discord.ui.DynamicItem[Button], template=r"wz:(?P<sid>[0-9a-z]+):(?P<action>[a-z]+)(?::(?P<arg>[\w-]+))?"):
+    """
+    Bouton à custom_id stable (wz:<session>:<action>[:<arg>]) : le clic est routé même après un
+    redémarrage, et la vue est reconstruite depuis l'état de la session.
+    """
+    def __init__(self, sid: str, action: str, arg: str | None = None, *, label: str = "\u200b",
+                 style: discord.ButtonStyle = discord.ButtonStyle.secondary, disabled: bool = False):
+        super().__init__(Button(
+            label=label, style=style, disabled=disabled,
+            custom_id=f"wz:{sid}:{action}" + (f":{arg}" if arg else "")
+        ))
+        self.sid, self.action, self.arg = sid, action, arg
+
+    @classmethod
+    async def from_custom_id(cls, interaction: discord.Interaction, item: Button, match: re.Match[str]):
+        return cls(match["sid"], match["action"], match["arg"])
 
-class MultiStepView(View):
-    def __init__(self, a, d):
-        super().__init__(timeout=900)
-        self.a = a
-        self.d = d
-        self.s = []
-        self.dispo = None
-        self.stage = "ask"
-
-    @discord.ui.button(label="Succès : Oui", style=discord.ButtonStyle.secondary, custom_id="y")
-    async def y(self, i: discord.Interaction, b: discord.ui.Button):
-        await self.succes(i, True)
-
-    @discord.ui.button(label="Succès : Non", style=discord.ButtonStyle.secondary, custom_id="n")
-    async def n(self, i: discord.Interaction, b: discord.ui.Button):
-        await self.succes(i, False)
-
-    async def succes(self, i: discord.Interaction, yes: bool):
-        self.clear_items()
-        if yes:
-            for l, c in DONJON_SUCCES.get(self.d, []):
-                disabled = c in DISABLED_SUCCES.get(self.d, [])
-                self.add_item(Button(
-                    label=l,
-                    style=(discord.ButtonStyle.danger if disabled else discord.ButtonStyle.secondary),
-                    custom_id=f"s_{c}",
-                    disabled=disabled
-                ))
-            self.stage = "sel"
+    async def callback(self, i: discord.Interaction):
+        await wizard_click(i, self.sid, self.action, self.arg)
+
+@instrumented("multistep_click")
+@acks.watch
+async def wizard_click(i: discord.Interaction, sid: str, action: str, arg: str | None):
+    st = wizards.get(sid)
+    if st is None:
+        return await rest.ack(i.response.send_message, "⏱️ Cette demande a expiré, relance /reservations.", ephemeral=True)
+    if i.user.id != st.user_id:
+        return await rest.ack(i.response.send_message, "❌ Cette demande ne t'appartient pas.", ephemeral=True)
+
+    if action == "y" and st.stage == "ask":
+        st.stage = "sel"
+    elif action == "n" and st.stage == "ask":
+        st.stage = "skip"
+    elif action == "s" and st.stage == "sel" and (st.d, arg) in CATALOG.code_label and (st.d, arg) not in CATALOG.disabled:
+        if arg in st.s:
+            st.s.remove(arg)
         else:
-            self.stage = "disp"
-
-        self.add_item(Button(label="Suivant ➜", style=discord.ButtonStyle.danger, custom_id="next"))
-        await i.response.edit_message(view=self)
+            st.s.append(arg)
+    elif action == "next" and st.stage in ("sel", "skip"):
+        st.stage = "disp"
+    elif action in DISPO_LABELS and st.stage == "disp":
+        st.dispo = action
+    elif action == "confirm" and st.stage == "disp" and st.dispo:
+        wizards.drop(sid)
+        return await MultiStepView(st).create(i)
+
+    wizards.touch(st)
+    view = MultiStepView(st)
+    await rest.ack(i.response.edit_message, view=view)
+    view.stop()
 
-    async def interaction_check(self, i: discord.Interaction):
-        cid = i.data.get("custom_id")
-
-        if self.stage == "sel" and cid.startswith("s_"):
-            c = cid[2:]
-            if c in self.s:
-                self.s.remove(c)
-            else:
-                self.s.append(c)
-            for x in self.children:
-                if hasattr(x, "custom_id") and x.custom_id == cid:
-                    x.style = discord.ButtonStyle.success if c in self.s else discord.ButtonStyle.secondary
-            await i.response.edit_message(view=self)
-            return False
-
-        if cid == "next":
-            self.clear_items()
-            for l, idv in [("✅ Dès que possible", "now"), ("📅 À planifier", "later")]:
-                self.add_item(Button(label=l, style=discord.ButtonStyle.secondary, custom_id=idv))
-            self.add_item(Button(label="Valider la demande", style=discord.ButtonStyle.danger, custom_id="confirm", disabled=True))
-            self.stage = "disp"
-            await i.response.edit_message(view=self)
-            return False
-
-        if self.stage == "disp" and cid in ["now", "later"]:
-            self.dispo = "Passage dès que possible" if cid == "now" else "Passage à planifier"
-            for x in self.children:
-                if hasattr(x, "custom_id") and x.custom_id in ["now", "later"]:
-                    x.style = discord.ButtonStyle.success if x.custom_id == cid else discord.ButtonStyle.secondary
-                if hasattr(x, "custom_id") and x.custom_id == "confirm":
-                    x.disabled = False
-            await i.response.edit_message(view=self)
-            return False
-
-        if self.stage == "disp" and cid == "confirm":
-            await self.create(i)
-            return False
-
-        return True
+class MultiStepView(View):
+    """
+    Vue de réservation construite depuis l'état de la session, à chaque clic.
+    Arrêtée dès l'envoi (discord.py la garderait 15 min) : les clics passent par les boutons dynamiques,
+    aucun objet View n'est gardé en mémoire entre deux clics.
+    """
+    def __init__(self, st: WizardState):
+        super().__init__(timeout=None)
+        self.st = st
+        sid = st.sid
+        if st.stage == "ask":
+            self.add_item(WizardButton(sid, "y", label="Succès : Oui"))
+            self.add_item(WizardButton(sid, "n", label="Succès : Non"))
+        elif st.stage in ("sel", "skip"):
+            if st.stage == "sel":
+                for spec in CATALOG.success_buttons.get(st.d, ()):
+                    style = discord.ButtonStyle.success if spec["code"] in st.s else spec["style"]
+                    self.add_item(WizardButton(sid, "s", spec["code"], label=spec["label"], style=style, disabled=spec["disabled"]))
+            self.add_item(WizardButton(sid, "next", label="Suivant ➜", style=discord.ButtonStyle.danger))
+        else:
+            for idv, l in [("now", "✅ Dès que possible"), ("later", "📅 À planifier")]:
+                style = discord.ButtonStyle.success if st.dispo == idv else discord.ButtonStyle.secondary
+                self.add_item(WizardButton(sid, idv, label=l, style=style))
+            self.add_item(WizardButton(sid, "confirm", label="Valider la demande", style=discord.ButtonStyle.danger, disabled=not st.dispo))
 
+    @instrumented("create")
+    @acks.watch
     async def create(self, i: discord.Interaction):
-        await i.response.defer(ephemeral=True)
+        await rest.ack(i.response.defer, ephemeral=True)
         g, a = i.guild, i.user
-        cat = g.get_channel(NEW_CATEGORY_ID)
-
-        pid = get_passeur_for_donjon(self.d)
-        p = g.get_member(pid)
-
-        ow = {
-            g.default_role: discord.PermissionOverwrite(view_channel=False),
-            g.me: discord.PermissionOverwrite(view_channel=True, send_messages=True),
-            a: discord.PermissionOverwrite(view_channel=True, send_messages=True),
-        }
-        for x in [p, g.get_member(OWNER_ID)]:
-            if x:
-                ow[x] = discord.PermissionOverwrite(view_channel=True, send_messages=True)
+        cfg = guild_configs.get(g.id) if g else None
+        if cfg is None:
+            return await rest.send(i.followup.send, "❌ Ce serveur n'est pas configuré pour les réservations.", ephemeral=True)
+        cat = pick_ticket_category(g, cfg)
 
-        ch = await g.create_text_channel(next_ticket_name(cat, TICKET_PREFIX), category=cat, overwrites=ow)
+        pid = assign_passeur(cfg, self.st.d)
+        ow = overwrites.ticket_overwrites(g, cfg, a, g.get_member(pid))
 
+        dispo = DISPO_LABELS.get(self.st.dispo, "Non précisé")
+        # Le topic part dans le payload de création : pas de ch.edit séparé
         try:
-            await ch.edit(topic=self.dispo or "Non précisé")
-        except:
-            pass
-
-        s = labels_from_success_codes(self.d, self.s)
-
-        # Message récapitulatif (source de vérité)
-        await ch.send(
-            f"{a.mention} • <@{pid}>",
-            embed=make_summary_embed(a, self.a, self.d, s, self.dispo or "Non précisé")
+            ch = await rest.send(
+                g.create_text_channel,
+                await next_ticket_name(g.id, cat, cfg.ticket_prefix), category=cat, overwrites=ow, topic=dispo
+            )
+        except Exception:
+            release_passeur(pid)
+            if cat is not None:
+                category_slots.done(cat, None)
+            raise
+        if cat is not None:
+            category_slots.done(cat, ch.id)  # compté jusqu'à son arrivée dans le cache gateway
+        log_bind(ticket=ch.id)
+        stored = False
+        s = labels_from_success_codes(self.st.d, self.st.s)
+
+        # Étapes indépendantes : lancées en parallèle dès que le salon existe
+        side = asyncio.gather(
+            rest.send(i.followup.send, f"✅ Ticket créé : {ch.mention}", ephemeral=True),
+            self.notify_demands(g, cfg, ch, a),
+            cleanup_user_messages(a.id),
+            return_exceptions=True
         )
-
-        dch = g.get_channel(DEMANDS_CHANNEL_ID)
+        try:
+            # Étapes ordonnées : récap puis bouton
+            recap_msg = await rest.send(
+                ch.send,
+                f"{a.mention} • <@{pid}>",
+                embed=make_summary_embed(a, self.st.a, self.st.d, s, dispo)
+            )
+            ticket_put(
+                ch.id, g.id, client_id=a.id, client_val=a.mention, passeur_id=pid,
+                zone=self.st.a, donjon=self.st.d, succes=s, dispo=dispo,
+                recap_message_id=recap_msg.id
+            )
+            stored = True
+            # Bouton validation persistant
+            await rest.send(ch.send, f"<@{pid}> — Cliquez pour valider le passage :", view=FeedbackPersistentView())
+        except Exception:
+            if not stored:
+                # Salon créé mais ticket jamais enregistré : la charge réservée est rendue
+                release_passeur(pid)
+            raise
+        finally:
+            for r in await side:
+                if isinstance(r, Exception):
+                    log.error("Étape annexe de création du ticket %s en échec", ch.id, exc_info=r)
+
+    async def notify_demands(self, g, cfg, ch, a):
+        dch = g.get_channel(cfg.demands_channel_id)
         if dch:
-            await dch.send(f"Nouveau ticket créé : {ch.mention} — {a.mention} (Donjon **{self.d}**)")
+            await rest.send(dch.send, f"Nouveau ticket créé : {ch.mention} — {a.mention} (Donjon **{self.st.d}**)")
 
-        # Bouton validation persistant
-        await ch.send(f"<@{pid}> — Cliquez pour valider le passage :", view=FeedbackPersistentView())
+async def cleanup_user_messages(user_id: int):
+    # Nettoyage des messages éphémères de CET utilisateur uniquement, deletes bornés
+    msgs = sessions.pop(user_id)
+    sem = asyncio.Semaphore(CLEANUP_CONCURRENCY)
 
-        sc = g.get_channel(SCREEN_CHANNEL_ID)
-        if sc and p:
+    async def rm(m):
+        async with sem:
             try:
-                await sc.set_permissions(p, view_channel=True, send_messages=True)
-            except:
-                pass
-
-        # Nettoyage messages éphémères
-        for lst in list(user_messages.values()):
-            for m in lst:
-                if m.author == bot.user:
-                    try:
-                        await m.delete()
-                    except:
-                        pass
-        user_messages.clear()
+                await rest.low(m.delete)
+            except discord.HTTPException:
+                log.info("Message éphémère déjà supprimé ou expiré", exc_info=True)
+
+    await asyncio.gather(*(rm(m) for m in msgs))
 
 class FeedbackPersistentView(View):
     """
     View persistante => survit aux reboots.
-    Elle relit les infos dans le message récap du ticket (aucune META visible).
+    Elle lit les infos du ticket dans le store local (repli : message récap du ticket).
     """
     def __init__(self):
         super().__init__(timeout=None)
@@ -328,43 +2328,32 @@ class FeedbackPersistentView(View):
         style=discord.ButtonStyle.danger,
         custom_id="passage_validate_v1"
     )
+    @instrumented("validate")
+    @acks.watch
     async def validate(self, interaction: discord.Interaction, button: discord.ui.Button):
         if not interaction.guild or not isinstance(interaction.channel, discord.TextChannel):
             return
+        log_bind(ticket=interaction.channel.id)
 
-        fb = interaction.guild.get_channel(FEEDBACK_CHANNEL_ID)
+        cfg = guild_configs.get(interaction.guild.id)
+        fb = interaction.guild.get_channel(cfg.feedback_channel_id) if cfg else None
         if not isinstance(fb, discord.TextChannel):
-            return await interaction.response.send_message("❌ Channel feedback introuvable.", ephemeral=True)
-
-        recap_msg = await find_recap_message(interaction.channel)
-        if not recap_msg or not recap_msg.embeds:
-            return await interaction.response.send_message("❌ Je ne retrouve pas le récapitulatif du ticket.", ephemeral=True)
-
-        recap = recap_msg.embeds[0]
-        client_val = read_field(recap, "Client") or ""
-        donjon_val = read_field(recap, "Donjon") or "Inconnu"
-        succes_val = read_field(recap, "Succès demandés") or "Aucun"
-
-        # Client id
-        client_id = extract_first_id_from_mention(client_val)
-        if not client_id:
-            ids = extract_all_ids_from_text(recap_msg.content)
-            client_id = ids[0] if ids else None
-
-        # Passeur id (dans "client • <@pid>")
-        ids_in_text = extract_all_ids_from_text(recap_msg.content)
-        passeur_id = None
-        if client_id:
-            for x in ids_in_text:
-                if x != client_id:
-                    passeur_id = x
-                    break
-        if not passeur_id:
-            passeur_id = OWNER_ID
-
-        # ✅ Autorisation : seul le passeur assigné ou OWNER_ID peut valider
-        if interaction.user.id not in (passeur_id, OWNER_ID):
-            return await interaction.response.send_message(
+            return await rest.ack(interaction.response.send_message, "❌ Channel feedback introuvable.", ephemeral=True)
+
+        t = await load_ticket(interaction.channel)
+        if not t:
+            return await rest.ack(interaction.response.send_message, "❌ Je ne retrouve pas le récapitulatif du ticket.", ephemeral=True)
+
+        client_id = t["client_id"]
+        client_val = t["client_val"] or ""
+        passeur_id = t["passeur_id"]
+        donjon_val = t["donjon"]
+        succes_val = t["succes"]
+
+        # ✅ Autorisation : seul le passeur assigné ou un propriétaire peut valider
+        if interaction.user.id != passeur_id and not is_owner(interaction.user.id, cfg):
+            return await rest.ack(
+                interaction.response.send_message,
                 "❌ Tu ne peux pas valider ce passage. Seul le passeur assigné (ou un admin) peut le faire.",
                 ephemeral=True
             )
@@ -375,52 +2364,42 @@ class FeedbackPersistentView(View):
         author_id = interaction.user.id
         client_mention = f"<@{client_id}>" if client_id else (client_val or "Client inconnu")
 
-        e = discord.Embed(title="Passage effectué !", color=0x2ECC71)
-        e.add_field(name="Par", value=f"<@{author_id}>", inline=False)
-        e.add_field(name="Pour", value=client_mention, inline=False)
-        e.add_field(name="Donjon", value=donjon_val, inline=False)
-        e.add_field(name="Succès demandés", value=succes_val or "Aucun", inline=False)
-        e.add_field(name="Disponibilité", value=disp, inline=False)
-        e.add_field(name="💬 Commentaires", value="*(Aucun commentaire pour le moment)*", inline=False)
-
-        await fb.send(embed=e)
+        model = FeedbackModel(None, f"<@{author_id}>", client_mention, donjon_val, succes_val or "Aucun", disp)
+        fbm = await rest.send(fb.send, embeds=model.render())
+        model.message_id = fbm.id
+        feedback_models.put(model)
+        passage_put(**passage_from_message(fbm))
+        if ticket_mark_validated(interaction.channel.id):
+            release_passeur(passeur_id)
+        feedback_index_put(interaction.guild.id, author_id, fbm.id)
 
         # supprime le message bouton pour éviter double validation
         try:
-            await interaction.message.delete()
-        except:
-            pass
+            await rest.low(interaction.message.delete)
+        except discord.HTTPException:
+            log.warning("Suppression du bouton de validation impossible", exc_info=True)
 
         try:
-            await interaction.response.defer(ephemeral=True)
-        except:
-            pass
+            await rest.ack(interaction.response.defer, ephemeral=True)
+        except discord.DiscordException:
+            log.warning("Ack de la validation impossible", exc_info=True)
 
 class AreaView(View):
+    # Un bouton par zone du catalogue : ajouter une zone ne demande aucune modification du code
     def __init__(self):
         super().__init__(timeout=None)
+        for zone in CATALOG.zones:
+            b = Button(label=zone, style=discord.ButtonStyle.primary, custom_id=CATALOG.zone_custom_ids[zone])
+            b.callback = functools.partial(self.handle_area, zone=zone)
+            self.add_item(b)
 
-    @discord.ui.button(label="Frigost 2", style=discord.ButtonStyle.primary, custom_id="area_f2")
-    async def f2(self, interaction: discord.Interaction, button: discord.ui.Button):
-        await self.handle_area(interaction, "Frigost 2")
-
-    @discord.ui.button(label="Pandala", style=discord.ButtonStyle.primary, custom_id="area_pandala")
-    async def pandala(self, interaction: discord.Interaction, button: discord.ui.Button):
-        await self.handle_area(interaction, "Pandala")
-
-    @discord.ui.button(label="Otomaii", style=discord.ButtonStyle.primary, custom_id="area_otoma")
-    async def otomaii(self, interaction: discord.Interaction, button: discord.ui.Button):
-        await self.handle_area(interaction, "Otomaii")
-
+    @instrumented("handle_area")
+    @acks.watch
     async def handle_area(self, interaction: discord.Interaction, zone: str):
-        dons = (
-            ["Obsidiantre","Tengu","Korriandre","Kolosso","Glours","Sakaii"] if zone=="Frigost 2"
-            else (["Nagate","Tanu","Founo","Dojo du vent","Damadrya","Katamashii"] if zone=="Pandala" else ["Kralamour","Kimbo"])
-        )
         v = View()
-        v.add_item(DonjonSelect(dons, zone))
-        await interaction.response.send_message(f"Choisissez le donjon {zone} :", view=v, ephemeral=True)
-        user_messages.setdefault(interaction.user.id, []).append(await interaction.original_response())
+        v.add_item(DonjonSelect(zone))
+        await rest.ack(interaction.response.send_message, f"Choisissez le donjon {zone} :", view=v, ephemeral=True)
+        sessions.track(interaction.user.id, await rest.low(interaction.original_response))
 
 class BotDashboardView(View):
     # On garde UNIQUEMENT "Lancer le bot". Pas de "Mettre hors ligne".
@@ -428,24 +2407,34 @@ class BotDashboardView(View):
         super().__init__(timeout=None)
 
     @discord.ui.button(label="🚀 Lancer le bot", style=discord.ButtonStyle.primary, custom_id="dash_launch")
+    @instrumented("dash_launch")
+    @acks.watch
     async def l(self, interaction: discord.Interaction, button: discord.ui.Button):
-        await interaction.response.send_message("🎟️ Choisissez la zone :", view=AreaView(), ephemeral=True)
-        user_messages.setdefault(interaction.user.id, []).append(await interaction.original_response())
+        await rest.ack(interaction.response.send_message, "🎟️ Choisissez la zone :", view=AreaView(), ephemeral=True)
+        sessions.track(interaction.user.id, await rest.low(interaction.original_response))
+
+async def find_dashboard_message(c: discord.TextChannel) -> discord.Message | None:
+    # Id persisté : un seul fetch au lieu d'un scan d'historique
+    mid = meta_get(guild_meta_key("dashboard_message_id", c.guild.id))
+    if mid:
+        try:
+            return await rest.low(c.fetch_message, int(mid))
+        except discord.NotFound:
+            log.info("Tableau de bord %s introuvable, recherche dans l'historique", mid)
+    # Repli (id inconnu ou message supprimé) : recherche dans l'historique
+    for m in await rest.low(collect_history, c, limit=50):
+        if m.author == bot.user and m.embeds and "Bot de création" in (m.embeds[0].title or ""):
+            return m
+    return None
 
-async def post_bot_dashboard():
-    global dashboard_message
+@instrumented("post_bot_dashboard")
+async def post_bot_dashboard(g: discord.Guild, cfg: GuildConfig):
     await bot.wait_until_ready()
-    g = bot.get_guild(GUILD_ID)
-    if not g:
-        return
-    c = g.get_channel(WAKEUP_CHANNEL_ID)
+    c = g.get_channel(cfg.wakeup_channel_id)
     if not c:
         return
 
-    async for m in c.history(limit=50):
-        if m.author == bot.user and m.embeds and "Bot de création" in (m.embeds[0].title or ""):
-            dashboard_message = m
-            break
+    dashboard_message = await find_dashboard_message(c)
 
     if not dashboard_message:
         e = discord.Embed(
@@ -455,22 +2444,26 @@ async def post_bot_dashboard():
         )
         e.add_field(name="État du bot", value="✅ En ligne")
         v = BotDashboardView()
-        msg = await c.send(embed=e, view=v)
+        msg = await rest.send(c.send, embed=e, view=v)
         try:
-            await msg.pin()
-        except:
-            pass
+            await rest.low(msg.pin)
+        except discord.HTTPException:
+            log.warning("Épinglage du tableau de bord impossible", exc_info=True)
         dashboard_message = msg
-    else:
+    elif read_field(dashboard_message.embeds[0], "État du bot") != "✅ En ligne":
+        # La view est persistante (add_view) : on n'édite que si l'état affiché est faux
         old = dashboard_message.embeds[0]
         e = discord.Embed(title=old.title, description=old.description, color=old.color)
         e.add_field(name="État du bot", value="✅ En ligne")
-        await dashboard_message.edit(embed=e, view=BotDashboardView())
+        await rest.low(dashboard_message.edit, embed=e, view=BotDashboardView())
+    meta_set(guild_meta_key("dashboard_message_id", g.id), dashboard_message.id)
 
-@bot.tree.command(name="reservations", description="Ouvre la procédure de réservation", guild=discord.Object(id=GUILD_ID))
+@bot.tree.command(name="reservations", description="Ouvre la procédure de réservation")
+@instrumented("reservations")
+@acks.watch
 async def reservations(i: discord.Interaction):
-    await i.response.send_message("🎟️ Choisissez la zone :", view=AreaView(), ephemeral=True)
-    user_messages.setdefault(i.user.id, []).append(await i.original_response())
+    await rest.ack(i.response.send_message, "🎟️ Choisissez la zone :", view=AreaView(), ephemeral=True)
+    sessions.track(i.user.id, await rest.low(i.original_response))
 
 # =========================
 # Commande secours : !rebtn
@@ -481,107 +2474,395 @@ async def rebtn(ctx: commands.Context):
     À utiliser dans un ticket si le message bouton a été supprimé.
     Renvoie un nouveau bouton persistant de validation.
     """
-    if ctx.author.id != OWNER_ID:
-        return await ctx.reply("❌ Seul le propriétaire peut utiliser cette commande.", delete_after=10)
+    if not is_owner(ctx.author.id, guild_configs.get(ctx.guild.id) if ctx.guild else None):
+        return await rest.send(ctx.reply, "❌ Seul le propriétaire peut utiliser cette commande.", delete_after=10)
     if not isinstance(ctx.channel, discord.TextChannel):
         return
-    recap = await find_recap_message(ctx.channel)
-    if not recap:
-        return await ctx.reply("❌ Je ne retrouve pas le récapitulatif dans ce ticket.", delete_after=15)
+    t = await load_ticket(ctx.channel)
+    if not t:
+        return await rest.send(ctx.reply, "❌ Je ne retrouve pas le récapitulatif dans ce ticket.", delete_after=15)
 
-    await ctx.send("🔁 Nouveau bouton de validation :", view=FeedbackPersistentView())
+    await rest.send(ctx.send, "🔁 Nouveau bouton de validation :", view=FeedbackPersistentView())
+
+# =========================
+# Commandes propriétaire
+# =========================
+def format_latency(st: LatencyStats) -> str:
+    p50, p95, p99 = st.quantiles(0.5, 0.95, 0.99)
+    return f"p50 {p50:.0f} • p95 {p95:.0f} • p99 {p99:.0f} ms (n={st.count})"
+
+@bot.tree.command(name="stats", description="Latences, appels REST et rate limits du bot")
+@acks.watch
+async def stats(i: discord.Interaction):
+    if i.user.id != OWNER_ID:
+        return await rest.ack(i.response.send_message, "❌ Seul le propriétaire peut utiliser cette commande.", ephemeral=True)
+    e = discord.Embed(title="📊 Statistiques du bot", color=0x2F3136)
+    lines = [
+        f"`{name}` {format_latency(st)}" + (f" • ❌ {metrics.errors[name]}" if metrics.errors[name] else "")
+        for name, st in sorted(metrics.handlers.items())
+    ]
+    e.add_field(name="Handlers", value="\n".join(lines) or "*(aucune mesure)*", inline=False)
+    deferred, rerouted = sum(metrics.ack_deferred.values()), sum(metrics.ack_rerouted.values())
+    failed = sum(metrics.ack_defer_failed.values())
+    e.add_field(
+        name="Temps avant ack",
+        value=f"{format_latency(metrics.time_to_ack)}\nDefers automatiques : {deferred} (échecs : {failed})"
+              f" • réponses en followup : {rerouted}",
+        inline=False
+    )
+    rm = rest.metrics()
+    top = sorted(rm["calls"].items(), key=lambda kv: -kv[1])[:10]
+    e.add_field(name="REST (top routes)", value="\n".join(f"`{r}` — {n}" for r, n in top) or "*(aucun appel)*", inline=False)
+    q = " • ".join(f"{k}: {v}" for k, v in rm["queued"].items())
+    rl = sum(metrics.ratelimit_waits.values())
+    e.add_field(
+        name="File / 429",
+        value=f"{q} • en vol : {rm['in_flight']}\n429 : {rl} (attente cumulée {metrics.ratelimit_wait_seconds:.1f} s)",
+        inline=False
+    )
+    top_exc = log_accounting.counts.most_common(5)
+    e.add_field(
+        name="Exceptions (top)",
+        value="\n".join(f"`{t}` @ `{w}` — {n}" for (w, t), n in top_exc) or "*(aucune)*",
+        inline=False
+    )
+    await rest.ack(i.response.send_message, embed=e, ephemeral=True)
+
+@bot.command(name="passeurs")
+async def passeurs_cmd(ctx: commands.Context):
+    """
+    Force le rechargement de la table des passeurs du serveur et affiche la table de routage actuelle.
+    """
+    cfg = guild_configs.get(ctx.guild.id) if ctx.guild else None
+    if cfg is None or not is_owner(ctx.author.id, cfg):
+        return await rest.send(ctx.reply, "❌ Seul le propriétaire peut utiliser cette commande.", delete_after=10)
+    try:
+        await reload_passeurs(cfg, force=True)
+        await reconcile_screen_access(ctx.guild)
+        head = "🔁 Table des passeurs rechargée"
+    except ValueError as e:
+        head = f"⚠️ Fichier invalide, table précédente conservée : {e}"
+    lines = [
+        f"• **{d}** → " + ", ".join(
+            f"<@{pid}>" + (f" ×{w:g}" if w != 1 else "") + f" ({open_load[pid]} ouverts)"
+            + (" 💤" if (cfg.guild_id, pid) in unavailable_passeurs else "")
+            for pid, w in pool
+        )
+        for d, pool in sorted(passeurs_for(cfg.guild_id).items())
+    ]
+    body = "\n".join(lines) if lines else "*(vide : tout est routé vers le propriétaire)*"
+    await rest.send(ctx.reply, f"{head}\n{body}", allowed_mentions=discord.AllowedMentions.none())
+
+@bot.command(name="dispo")
+async def dispo_cmd(ctx: commands.Context, member: discord.Member | None = None):
+    """
+    Bascule la disponibilité d'un passeur (soi-même ; le propriétaire peut cibler quelqu'un).
+    Un passeur indisponible ne reçoit plus de nouveaux tickets de ce serveur.
+    """
+    if ctx.guild is None:
+        return
+    target = member or ctx.author
+    if target.id != ctx.author.id and not is_owner(ctx.author.id, guild_configs.get(ctx.guild.id)):
+        return await rest.send(ctx.reply, "❌ Seul le propriétaire peut changer la disponibilité d'un autre passeur.", delete_after=10)
+    key = (ctx.guild.id, target.id)
+    available = key in unavailable_passeurs
+    set_passeur_available(ctx.guild.id, target.id, available)
+    if available:
+        unavailable_passeurs.discard(key)
+    else:
+        unavailable_passeurs.add(key)
+    state = "✅ disponible" if available else "💤 indisponible"
+    await rest.send(ctx.reply, f"{target.mention} est maintenant {state}.", allowed_mentions=discord.AllowedMentions.none())
+
+@bot.command(name="sweep")
+async def sweep_cmd(ctx: commands.Context, minutes: int | None = None):
+    """
+    Archive maintenant les tickets validés depuis plus de `minutes` (défaut : TICKET_CLOSE_DELAY).
+    """
+    if not ctx.guild:
+        return
+    if not is_owner(ctx.author.id, guild_configs.get(ctx.guild.id)):
+        return await rest.send(ctx.reply, "❌ Seul le propriétaire peut utiliser cette commande.", delete_after=10)
+    delay = TICKET_CLOSE_DELAY if minutes is None else minutes * 60
+    n = await sweep_tickets(ctx.guild, delay)
+    await rest.send(ctx.reply, f"🗄️ {n} ticket(s) archivé(s).")
+
+def owner_only(ctx: commands.Context) -> bool:
+    # Statistiques par guilde : réservées à son propriétaire (ou à celui du bot)
+    return ctx.guild is not None and is_owner(ctx.author.id, guild_configs.get(ctx.guild.id))
+
+@bot.command(name="top")
+async def top_cmd(ctx: commands.Context, n: int = 10, jours: int = 30):
+    """
+    Classement des passeurs sur les `jours` derniers jours (données locales).
+    """
+    if not owner_only(ctx):
+        return await rest.send(ctx.reply, "❌ Seul le propriétaire peut utiliser cette commande.", delete_after=10)
+    rows = passages_leaderboard(ctx.guild.id, time.time() - jours * 86400, max(1, min(n, 50)))
+    lines = [f"**{k}.** <@{r['passeur_id']}> — {r['n']}" for k, r in enumerate(rows, 1)]
+    body = "\n".join(lines) or "*(aucun passage)*"
+    await rest.send(ctx.reply, f"🏆 Passages sur {jours} j\n{body}", allowed_mentions=discord.AllowedMentions.none())
+
+@bot.command(name="fil")
+async def fil_cmd(ctx: commands.Context, message_id: int, page: int = 1):
+    """
+    Fil complet des commentaires d'un feedback (l'embed n'affiche que les derniers).
+    """
+    if not owner_only(ctx):
+        return await rest.send(ctx.reply, "❌ Seul le propriétaire peut utiliser cette commande.", delete_after=10)
+    if ctx.author.id != OWNER_ID and passage_guild_id(message_id) != ctx.guild.id:
+        return await rest.send(ctx.reply, "❌ Ce feedback n'appartient pas à ce serveur.", delete_after=10)
+    per_page = 15
+    total = comments_count(message_id)
+    pages = max(1, -(-total // per_page))
+    page = max(1, min(page, pages))
+    rows = comments_page(message_id, (page - 1) * per_page, per_page)
+    lines = [f"<t:{int(r['created_at'])}:f> {r['label']}: {r['text']}" for r in rows]
+    body = "\n".join(lines) or "*(aucun commentaire)*"
+    await rest.send(ctx.reply, f"💬 Commentaires de `{message_id}` — page {page}/{pages} ({total})\n{body}"[:2000],
+                    allowed_mentions=discord.AllowedMentions.none())
+
+@bot.command(name="semaines")
+async def semaines_cmd(ctx: commands.Context, n: int = 8):
+    """
+    Nombre de passages par semaine sur les `n` dernières semaines.
+    """
+    if not owner_only(ctx):
+        return await rest.send(ctx.reply, "❌ Seul le propriétaire peut utiliser cette commande.", delete_after=10)
+    rows = passages_weekly(ctx.guild.id, max(1, min(n, 52)))
+    body = "\n".join(f"`{r['week']}` — {r['n']}" for r in rows) or "*(aucun passage)*"
+    await rest.send(ctx.reply, f"📅 Passages par semaine\n{body}")
+
+@bot.command(name="donjons")
+async def donjons_cmd(ctx: commands.Context, jours: int = 30):
+    """
+    Passages par donjon et par succès sur les `jours` derniers jours.
+    """
+    if not owner_only(ctx):
+        return await rest.send(ctx.reply, "❌ Seul le propriétaire peut utiliser cette commande.", delete_after=10)
+    per_donjon, per_succes = Counter(), Counter()
+    for r in passages_by_donjon(ctx.guild.id, time.time() - jours * 86400):
+        per_donjon[r["donjon"]] += r["n"]
+        for lbl in r["succes"].split(", "):
+            if lbl and lbl != "Aucun":
+                per_succes[(r["donjon"], lbl)] += r["n"]
+    lines = []
+    for d, n in per_donjon.most_common(15):
+        sx = ", ".join(f"{lbl} {k}" for (dd, lbl), k in per_succes.most_common() if dd == d)
+        lines.append(f"• **{d}** — {n}" + (f" ({sx})" if sx else ""))
+    await rest.send(ctx.reply, f"🗺️ Passages par donjon sur {jours} j\n" + ("\n".join(lines) or "*(aucun passage)*"))
+
+@bot.command(name="sync")
+async def sync_cmd(ctx: commands.Context):
+    """
+    Force la synchronisation des slash commands (normalement faite seulement si elles changent).
+    """
+    if ctx.author.id != OWNER_ID:
+        return await rest.send(ctx.reply, "❌ Seul le propriétaire peut utiliser cette commande.", delete_after=10)
+    for gid in guild_configs.ids():
+        await sync_commands(gid, force=True)
+    await rest.send(ctx.reply, "✅ Slash commands synchronisées.")
+
+@bot.command(name="rest")
+async def rest_cmd(ctx: commands.Context):
+    """
+    État de l'ordonnanceur REST : profondeur des files, appels en vol, appels par méthode,
+    429 absorbés par discord.py par route HTTP.
+    """
+    if ctx.author.id != OWNER_ID:
+        return await rest.send(ctx.reply, "❌ Seul le propriétaire peut utiliser cette commande.", delete_after=10)
+    mt = rest.metrics()
+    q = " • ".join(f"{k}: {v}" for k, v in mt["queued"].items())
+    top = sorted(mt["calls"].items(), key=lambda kv: -kv[1])[:10]
+    lines = [f"`{r}` — {n}" for r, n in top]
+    # 429 : discord.py attend et réessaie lui-même, seuls ses warnings les rendent visibles
+    waits = sorted(metrics.ratelimit_waits.items(), key=lambda kv: -kv[1])[:5]
+    rl = "\n".join(f"`{r}` — 429 × {n}" for r, n in waits) or "*(aucun 429)*"
+    await rest.send(
+        ctx.reply,
+        f"📡 File : {q} • en vol : {mt['in_flight']}\n" + ("\n".join(lines) or "*(aucun appel)*")
+        + f"\n⏳ Attentes 429 : {metrics.ratelimit_wait_seconds:.1f} s (globales : {metrics.ratelimit_global})\n{rl}"
+    )
+
+@bot.command(name="config")
+async def config_cmd(ctx: commands.Context, key: str | None = None, *, value: str | None = None):
+    """
+    Configuration du serveur courant : `!config` l'affiche, `!config <clé> <valeur>` la modifie.
+    Configurer une première clé active le bot sur un serveur partenaire.
+    """
+    if not ctx.guild:
+        return
+    cfg = guild_configs.get(ctx.guild.id)
+    if not is_owner(ctx.author.id, cfg):
+        return await rest.send(ctx.reply, "❌ Seul le propriétaire peut utiliser cette commande.", delete_after=10)
+    if key is not None:
+        if value is None:
+            return await rest.send(ctx.reply, f"Usage : `{COMMAND_PREFIX}config {key} <valeur>`", delete_after=15)
+        if key in GuildConfig.BOT_OWNER_FIELDS and ctx.author.id != OWNER_ID:
+            return await rest.send(ctx.reply, f"❌ `{key}` ne peut être modifié que par le propriétaire du bot.", delete_after=15)
+        try:
+            cfg = guild_configs.update(ctx.guild.id, key, value)
+        except ValueError as e:
+            return await rest.send(ctx.reply, f"❌ {e}", delete_after=15)
+        overwrites.invalidate(ctx.guild.id)
+        try:
+            await reload_passeurs(cfg, force=True)
+        except ValueError as e:
+            log.warning("Table des passeurs de %s invalide : %s", ctx.guild.id, e)
+        await reconcile_screen_access(ctx.guild)
+        await sync_commands(ctx.guild.id)
+    if cfg:
+        body = "\n".join(f"`{k}` = {getattr(cfg, k)}" for k in GuildConfig.FIELDS)
+    else:
+        body = "*(serveur non configuré)* — clés : " + ", ".join(f"`{k}`" for k in GuildConfig.FIELDS)
+    await rest.send(ctx.reply, f"⚙️ Configuration de **{ctx.guild.name}**\n{body}")
 
 # =========================
 # Events: Screens + Comments robustes
 # =========================
+# Routage par rôle de salon ("screen", "feedback") : chaque guilde mappe ses salons sur ces rôles
+message_routes: dict[str, list] = {}
+
+def route_channel(*kinds: str):
+    def deco(fn):
+        for k in kinds:
+            message_routes.setdefault(k, []).append(fn)
+        return fn
+    return deco
+
+@route_channel("screen")
+@instrumented("on_screen")
+async def on_screen(m: discord.Message):
+    # 1) Screens: on colle les images sur le dernier feedback où "Par" = auteur
+    if m.attachments and m.guild:
+        fb = m.guild.get_channel(guild_configs.get(m.guild.id).feedback_channel_id)
+        mid = feedback_index_get(m.guild.id, m.author.id) if isinstance(fb, discord.TextChannel) else None
+        if mid:
+            feedback_edits.submit(fb, mid, FeedbackEdit(m.author.id, images=asyncio.create_task(new_screens(m, mid))))
+
+@route_channel("feedback")
+@instrumented("on_feedback_reply")
+async def on_feedback_reply(m: discord.Message):
+    # 2) Commentaires: si reply dans feedback channel, on modifie l'embed ciblé (édition groupée)
+    if not (m.reference and m.reference.message_id):
+        return
+    txt = (m.content or "").strip()
+    # Mise en file immédiate (ordre d'arrivée) ; les screens éventuels la rejoignent une fois téléchargés
+    imgs = asyncio.create_task(new_screens(m, m.reference.message_id)) if m.attachments else ()
+    feedback_edits.submit(m.channel, m.reference.message_id, FeedbackEdit(m.author.id, txt, imgs, reply=m))
+
 @bot.event
+@instrumented("on_message")
 async def on_message(m: discord.Message):
-    # 1) Screens: on colle l'image sur le dernier feedback où "Par" = auteur
-    if m.channel.id == SCREEN_CHANNEL_ID and not m.author.bot:
-        if m.attachments and m.guild:
-            a = m.attachments[0]
-            if "image" in (a.content_type or ""):
-                fbm = await find_latest_feedback_message_for_author(m.guild, m.author.id)
-                if fbm and fbm.embeds:
-                    e = fbm.embeds[0]
-                    e.set_image(url=a.url)
-                    try:
-                        await fbm.edit(embed=e)
-                    except:
-                        pass
-
-    # 2) Commentaires: si reply dans feedback channel, on modifie l'embed ciblé
-    if (
-        m.channel.id == FEEDBACK_CHANNEL_ID
-        and not m.author.bot
-        and m.reference
-        and m.reference.message_id
-    ):
+    # Sortie immédiate : bots, salons sans handler, messages sans préfixe de commande
+    if m.author.bot:
+        return
+    cfg = guild_configs.get(m.guild.id) if m.guild else None
+    if cfg is not None:
+        for h in message_routes.get(cfg.routes.get(m.channel.id), ()):
+            # Tâches indépendantes : un fetch lent dans un salon ne bloque pas les autres
+            spawn(h(m))
+    if m.content.startswith(COMMAND_PREFIX):
+        await bot.process_commands(m)
+
+def command_tree_hash(guild: discord.abc.Snowflake) -> str:
+    payload = []
+    for c in bot.tree.get_commands(guild=guild):
         try:
-            fbm = await m.channel.fetch_message(m.reference.message_id)
-        except:
-            fbm = None
-
-        if fbm and fbm.author == bot.user and fbm.embeds:
-            e = fbm.embeds[0]
-            if e.title and "Passage effectué" in e.title:
-                txt = (m.content or "").strip()
-
-                par_id = extract_first_id_from_mention(read_field(e, "Par") or "")
-                client_id = extract_first_id_from_mention(read_field(e, "Pour") or "")
-
-                if m.author.id == OWNER_ID:
-                    label = "🔴 Immo"
-                elif par_id and m.author.id == par_id:
-                    label = "👑 Passeur"
-                elif client_id and m.author.id == client_id:
-                    label = "👤 Client"
-                else:
-                    label = "👤 Client"
+            payload.append(c.to_dict(bot.tree))
+        except TypeError:  # discord.py < 2.4
+            payload.append(c.to_dict())
+    return hashlib.sha256(json.dumps(payload, sort_keys=True, default=str).encode()).hexdigest()
+
+async def sync_commands(guild_id: int, force: bool = False) -> bool:
+    """tree.sync (très limité en débit) uniquement si l'arbre des commandes a changé."""
+    guild = discord.Object(id=guild_id)
+    # Commandes déclarées globalement, publiées comme commandes de guilde (propagation immédiate)
+    bot.tree.copy_global_to(guild=guild)
+    h = command_tree_hash(guild)
+    key = f"tree_hash:{guild_id}"
+    if not force and meta_get(key) == h:
+        return False
+    await rest.low(bot.tree.sync, guild=guild)
+    meta_set(key, h)
+    return True
+
+async def setup_hook():
+    # Exécuté UNE fois par process, avant la connexion à la gateway
+    # Views persistantes (crucial pour survivre aux reboots)
+    bot.add_view(FeedbackPersistentView())
+    bot.add_view(BotDashboardView())
+    bot.add_dynamic_items(WizardButton)
+    spawn(wizards.run(WIZARD_FLUSH_MS / 1000))
 
-                if txt:
-                    current = read_field(e, "💬 Commentaires") or ""
-                    lines = [x for x in current.split("\n") if x.strip() and "*(Aucun" not in x]
-                    lines.append(f"{label}: {txt}")
-                    new_comments = "\n".join(lines[-8:]) if lines else "*(Aucun commentaire pour le moment)*"
-                    update_or_add_comment_field(e, new_comments)
+    for gid in guild_configs.ids():
+        try:
+            await reload_passeurs(guild_configs.get(gid), force=True)
+        except ValueError as e:
+            log.warning("Table des passeurs de %s invalide : %s", gid, e)
+    load_passeur_state()
+    spawn(watch_passeurs())
+    if METRICS_PROM_PATH:
+        spawn(export_metrics_loop())
+
+    for gid in guild_configs.ids():
+        try:
+            if await sync_commands(gid):
+                log.info("Slash commands synchronisées sur la guilde %s", gid)
+        except discord.HTTPException:
+            log.exception("Synchronisation des slash commands de %s impossible", gid)
 
-                if m.attachments:
-                    a = m.attachments[0]
-                    if "image" in (a.content_type or ""):
-                        e.set_image(url=a.url)
+bot.setup_hook = setup_hook
 
-                try:
-                    await fbm.edit(embed=e)
-                except:
-                    pass
+close_bot = bot.close
 
-                try:
-                    await m.delete()
-                except:
-                    pass
+async def close():
+    # Session HTTP des screens fermée avant la boucle
+    await screens.close()
+    await close_bot()
 
-    await bot.process_commands(m)
+bot.close = close
 
 @bot.event
-async def on_ready():
-    print(f"✅ Connecté en tant que {bot.user}")
-    try:
-        await bot.tree.sync(guild=discord.Object(id=GUILD_ID))
-        print("✅ Slash commands synchronisées sur la guilde", GUILD_ID)
-    except Exception as e:
-        print("❌ Sync erreur:", e)
+async def on_guild_channel_delete(ch: discord.abc.GuildChannel):
+    drop_open_ticket(ch.id)
 
-    # Enregistre la view persistante au démarrage (crucial pour survivre aux reboots)
-    bot.add_view(FeedbackPersistentView())
+@bot.event
+async def on_ready():
+    global ready_once
+    # Salons de tickets supprimés hors connexion : la charge des passeurs est recalculée sans eux
+    for g, _ in guild_configs.active():
+        n = prune_open_tickets(g)
+        if n:
+            log.info("%d ticket(s) ouvert(s) sans salon oublié(s) sur %s", n, g.id)
+    if ready_once:
+        # Reconnexion gateway : tout est déjà en place
+        log.info("Reconnecté en tant que %s", bot.user)
+        return
+    ready_once = True
+    log.info("Connecté en tant que %s", bot.user)
+    spawn(ticket_sweeper())
 
-    await post_bot_dashboard()
+    for g, cfg in guild_configs.active():
+        # Une guilde partenaire mal configurée (salon supprimé, droits manquants) ne bloque pas les autres
+        try:
+            await post_bot_dashboard(g, cfg)
+            await reconcile_screen_access(g)
+            await sync_feedback_history(g)
+        except Exception:
+            log.exception("Initialisation de la guilde %s (%s) incomplète", g.id, g.name)
 
 def main():
     t = os.getenv("DISCORD_TOKEN")
     if not t:
         raise RuntimeError("DISCORD_TOKEN manquant (mets-le dans .env ou variable d'environnement)")
-    bot.run(t)
+    setup_logging()
+    try:
+        bot.run(t, log_handler=None)
+    finally:
+        # Dernières écritures du journal des sessions de réservation, puis vidage des logs
+        wizards.flush()
+        log_listener.stop()
 
 if __name__ == "__main__":
     main()
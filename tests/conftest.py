@@ -0,0 +1,38 @@
+"""
+Tests hors ligne : même couche Discord factice et même guilde câblée que les benchmarks.
+L'import de benchmarks/run.py isole le store (DATA_DIR temporaire) avant l'import du bot.
+"""
+import sys, asyncio
+from pathlib import Path
+
+import pytest
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "benchmarks"))
+
+from run import World, settle  # noqa: E402  (DATA_DIR temporaire avant `import main`)
+import main  # noqa: E402
+
+@pytest.fixture(scope="session")
+def loop():
+    # Une seule boucle : le bot garde des objets liés à la boucle (session HTTP, workers REST)
+    lp = asyncio.new_event_loop()
+    yield lp
+    lp.run_until_complete(main.screens.close())
+    lp.close()
+
+@pytest.fixture
+def run(loop):
+    return loop.run_until_complete
+
+@pytest.fixture
+def world(run):
+    main.feedback_edits.debounce = 0
+    return World(0)
+
+@pytest.fixture
+def flush(run):
+    """Laisse finir les handlers lancés par le routeur puis les éditions groupées."""
+    async def _flush():
+        await settle()
+        await main.feedback_edits.drain()
+    return lambda: run(_flush())
@@ -0,0 +1,76 @@
+import pytest
+
+import main
+from fake_discord import next_id
+
+@pytest.fixture
+def cfg(world):
+    main.open_load.clear()
+    main.unavailable_passeurs.clear()
+    return main.guild_configs.get(main.GUILD_ID)
+
+def pool(*entries):
+    main.passeurs_maps[main.GUILD_ID] = main.MappingProxyType({"Tanu": main.parse_pool("Tanu", list(entries))})
+
+def test_least_loaded_by_weight(cfg):
+    a, b = next_id(), next_id()
+    pool({"id": a, "weight": 2}, b)
+    picks = [main.assign_passeur(cfg, "Tanu") for _ in range(6)]
+    assert picks.count(a) == 4 and picks.count(b) == 2
+
+def test_unavailable_skipped_then_owner_fallback(cfg):
+    a = next_id()
+    pool(a)
+    main.unavailable_passeurs.add((cfg.guild_id, a))
+    assert main.get_passeur_for_donjon(cfg, "Tanu") == cfg.owner_id
+    assert main.get_passeur_for_donjon(cfg, "Inconnu") == cfg.owner_id
+
+def test_deleted_unvalidated_ticket_releases_load(cfg, world, run):
+    a = next_id()
+    pool(a)
+    pid = main.assign_passeur(cfg, "Tanu")
+    ch = world.ticket_channel()
+    main.ticket_put(ch.id, world.g.id, client_id=world.client.id, passeur_id=pid, donjon="Tanu", succes="Aucun")
+    run(ch.delete())
+    run(main.on_guild_channel_delete(ch))
+    assert main.open_load[a] == 0
+    assert main.ticket_get(ch.id) is None
+
+def test_prune_forgets_tickets_without_channel(cfg, world):
+    a, gone = next_id(), next_id()
+    kept = world.ticket_channel()
+    for cid in (kept.id, gone):
+        main.ticket_put(cid, world.g.id, client_id=world.client.id, passeur_id=a, donjon="Tanu", succes="Aucun")
+    main.prune_open_tickets(world.g)
+    main.load_passeur_state()
+    assert main.ticket_get(gone) is None and main.ticket_get(kept.id) is not None
+    assert main.open_load[a] == 1
+
+def test_failed_recap_releases_load(cfg, world, run, monkeypatch):
+    a = next_id()
+    pool(a)
+    st = main.wizards.new(main.base36(next_id()), world.client.id, "Pandala", "Tanu")
+    st.dispo = "now"
+
+    def boom(*args):
+        raise RuntimeError("récap")
+    monkeypatch.setattr(main, "make_summary_embed", boom)
+    with pytest.raises(RuntimeError):
+        run(main.MultiStepView(st).create(world.interaction(world.client)))
+    assert main.open_load[a] == 0
+
+def test_unavailability_is_per_guild(cfg, world):
+    a, other = next_id(), next_id()
+    pool(a)
+    main.set_passeur_available(other, a, False)
+    main.load_passeur_state()
+    assert main.get_passeur_for_donjon(cfg, "Tanu") == a
+    main.set_passeur_available(other, a, True)
+
+def test_rebuilt_ticket_counts_its_load(cfg, world, run):
+    ch = world.ticket_channel()
+    t = run(main.load_ticket(ch))
+    assert t["passeur_id"] == world.passeur.id and t["validated_at"] is None
+    assert main.open_load[world.passeur.id] == 1
+    run(main.load_ticket(ch))
+    assert main.open_load[world.passeur.id] == 1
@@ -0,0 +1,33 @@
+import sqlite3
+
+import main
+from fake_discord import next_id
+
+def test_reports_are_per_guild(world):
+    other, p = next_id(), next_id()
+    for gid, n in ((world.g.id, 2), (other, 3)):
+        for _ in range(n):
+            main.passage_put(next_id(), gid, p, world.client.id, "Tanu", "Aucun", 1e9)
+    assert [r["n"] for r in main.passages_leaderboard(other, 0, 10)] == [3]
+    assert sum(r["n"] for r in main.passages_by_donjon(other, 0)) == 3
+    assert main.passages_leaderboard(next_id(), 0, 10) == []
+
+def test_legacy_passages_go_to_main_guild(tmp_path, monkeypatch):
+    path = tmp_path / "old.sqlite3"
+    old = sqlite3.connect(path)
+    old.executescript(
+        "CREATE TABLE passages (message_id INTEGER PRIMARY KEY, passeur_id INTEGER, client_id INTEGER, "
+        "donjon TEXT, succes TEXT, created_at REAL NOT NULL);"
+        "CREATE INDEX passages_created_at ON passages (created_at);"
+        "INSERT INTO passages VALUES (1, 2, 3, 'Tanu', 'Aucun', 1e9);"
+    )
+    old.close()
+    monkeypatch.setattr(main, "DB_PATH", path)
+    monkeypatch.setattr(main, "_db", None)
+    conn = main.db()
+    try:
+        assert [r["n"] for r in main.passages_leaderboard(main.GUILD_ID, 0, 10)] == [1]
+        idx = {r["name"] for r in conn.execute("PRAGMA index_list(passages)")}
+        assert "passages_guild_created_at" in idx
+    finally:
+        conn.close()
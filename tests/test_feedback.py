@@ -0,0 +1,80 @@
+import main
+from fake_discord import FakeAttachment, FakeGuild, FakeReference, FakeUser, next_id
+
+def comments(fbm):
+    return [r["text"] for r in main.comments_page(fbm.id, 0, 100)]
+
+def reply(world, fbm, author, text):
+    return main.on_message(world.feedback.add_message(author, text, reference=FakeReference(fbm.id)))
+
+def test_burst_is_one_edit_in_order(world, run, flush):
+    fbm = world.feedback_message(world.passeur, world.client)
+    main.feedback_edits.debounce = 0.02
+    before = world.rest.calls.copy()
+    for k in range(5):
+        run(reply(world, fbm, (world.client, world.passeur)[k % 2], f"c{k}"))
+    flush()
+    assert world.rest.calls["message.edit"] - before["message.edit"] == 1
+    assert world.rest.calls["channel.delete_messages"] - before["channel.delete_messages"] == 1
+    assert comments(fbm) == [f"c{k}" for k in range(5)]
+    field = main.read_field(fbm.embeds[0], main.COMMENTS_FIELD)
+    assert field.splitlines()[0].startswith("👤 Client: c0")
+
+def test_cached_model_skips_fetch(world, run, flush):
+    fbm = world.feedback_message(world.passeur, world.client)
+    run(reply(world, fbm, world.client, "premier"))
+    flush()
+    fetches = world.rest.calls["channel.fetch_message"]
+    run(reply(world, fbm, world.client, "second"))
+    flush()
+    assert world.rest.calls["channel.fetch_message"] == fetches
+
+def test_long_thread_keeps_everything(world, run, flush):
+    fbm = world.feedback_message(world.passeur, world.client)
+    n = main.FEEDBACK_COMMENT_TAIL + 5
+    for k in range(n):
+        run(reply(world, fbm, world.client, f"c{k}"))
+        flush()
+    assert comments(fbm) == [f"c{k}" for k in range(n)]
+    lines = main.read_field(fbm.embeds[0], main.COMMENTS_FIELD).splitlines()
+    assert f"+5 plus ancien(s) : {main.COMMAND_PREFIX}fil {fbm.id}" in lines[0]
+    assert len(lines) == main.FEEDBACK_COMMENT_TAIL + 1
+
+def test_deleted_feedback_drops_only_its_index_entry(world, run, flush):
+    fbm = world.feedback_message(world.passeur, world.client)
+    main.feedback_index_put(world.g.id, world.passeur.id, fbm.id)
+    other = next_id()
+    main.feedback_index_put(other, world.passeur.id, 42)
+    del world.feedback._messages[fbm.id]
+    main.feedback_models.drop(fbm.id)
+    async def screen():
+        main.feedback_edits.submit(world.feedback, fbm.id, main.FeedbackEdit(world.passeur.id, "x"))
+    run(screen())
+    flush()
+    assert main.feedback_index_get(world.g.id, world.passeur.id) is None
+    assert main.feedback_index_get(other, world.passeur.id) == 42
+
+def test_screen_in_other_guild_keeps_main_guild_index(world, run, flush):
+    fbm = world.feedback_message(world.passeur, world.client)
+    main.feedback_index_put(world.g.id, world.passeur.id, fbm.id)
+    g2 = FakeGuild(world.rest, next_id(), world.me)
+    g2.add_member(world.passeur)
+    fb2 = g2.add_text_channel(next_id(), "feedback")
+    sc2 = g2.add_text_channel(next_id(), "screens")
+    main.guild_configs.update(g2.id, "feedback_channel_id", str(fb2.id))
+    main.guild_configs.update(g2.id, "screen_channel_id", str(sc2.id))
+    run(main.on_message(sc2.add_message(world.passeur, "", attachments=[FakeAttachment("http://127.0.0.1:9/x.png")])))
+    flush()
+    assert main.feedback_index_get(world.g.id, world.passeur.id) == fbm.id
+
+def test_partner_owner_comment_label(world, run, flush):
+    fbm = world.feedback_message(world.passeur, world.client)
+    partner = world.g.add_member(FakeUser(next_id(), "partenaire"))
+    main.guild_configs.update(world.g.id, "owner_id", str(partner.id))
+    try:
+        run(reply(world, fbm, partner, "bien joué"))
+        run(reply(world, fbm, world.owner, "merci"))
+        flush()
+    finally:
+        main.guild_configs.update(world.g.id, "owner_id", str(main.OWNER_ID))
+    assert [r["label"] for r in main.comments_page(fbm.id, 0, 100)] == ["🔴 Propriétaire", "🔴 Immo"]
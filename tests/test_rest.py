@@ -0,0 +1,155 @@
+import asyncio
+import logging
+
+import main
+
+class Chan:
+    """Ressource factice : les appels `send` d'un même salon partagent un bucket."""
+    def __init__(self, id, log):
+        self.id = id
+        self.log = log
+        self.active = 0
+        self.peak = 0
+
+    async def send(self, tag, gate=None):
+        self.active += 1
+        self.peak = max(self.peak, self.active)
+        try:
+            if gate is not None:
+                await gate.wait()
+            await asyncio.sleep(0)
+            self.log.append(tag)
+        finally:
+            self.active -= 1
+
+def test_send_jumps_ahead_of_low(run):
+    async def scenario():
+        order = []
+        sched = main.RestScheduler(1)
+        gate = asyncio.Event()
+        a, b = Chan(1, order), Chan(2, order)
+        first = asyncio.create_task(sched.low(a.send, "blocker", gate))
+        await asyncio.sleep(0)
+        low = asyncio.create_task(sched.low(b.send, "low"))
+        send = asyncio.create_task(sched.send(b.send, "send"))
+        await asyncio.sleep(0)
+        gate.set()
+        await asyncio.gather(first, low, send)
+        return order
+    assert run(scenario()) == ["blocker", "send", "low"]
+
+def test_one_call_in_flight_per_bucket(run):
+    async def scenario():
+        sched = main.RestScheduler(4)
+        a, b = Chan(1, []), Chan(2, [])
+        await asyncio.gather(*(sched.low(c.send, k) for k in range(4) for c in (a, b)))
+        return a.peak, b.peak, sched.in_flight
+    assert run(scenario()) == (1, 1, 0)
+
+def test_errors_reach_the_caller(run):
+    class Boom(Chan):
+        async def send(self, tag, gate=None):
+            raise ValueError(tag)
+
+    async def scenario():
+        sched = main.RestScheduler(2)
+        try:
+            await sched.send(Boom(1, []).send, "x")
+        except ValueError as e:
+            return str(e), sched.in_flight
+    assert run(scenario()) == ("x", 0)
+
+def test_ratelimit_warnings_are_counted_by_route():
+    before = main.metrics.ratelimit_waits.copy()
+    logging.getLogger("discord.http").warning(
+        "We are being rate limited. %s %s responded with 429. Retrying in %.2f seconds.",
+        "PATCH", "https://discord.com/api/v10/channels/1393982298654900345/messages/1393982298654900346", 1.5
+    )
+    diff = main.metrics.ratelimit_waits - before
+    assert dict(diff) == {"PATCH /api/v10/channels/{id}/messages/{id}": 1}
+
+def test_busy_bucket_does_not_hold_a_worker(run):
+    async def scenario():
+        order = []
+        sched = main.RestScheduler(2)
+        gate = asyncio.Event()
+        a, b = Chan(1, order), Chan(2, order)
+        blocked = [asyncio.create_task(sched.low(a.send, "a1", gate)), asyncio.create_task(sched.low(a.send, "a2"))]
+        await asyncio.sleep(0)
+        await asyncio.wait_for(sched.send(b.send, "b"), 1)
+        done_before_gate = list(order)
+        gate.set()
+        await asyncio.gather(*blocked)
+        return done_before_gate, order
+    assert run(scenario()) == (["b"], ["b", "a1", "a2"])
+
+def test_bucket_keeps_priority_then_arrival_order(run):
+    async def scenario():
+        order = []
+        sched = main.RestScheduler(3)
+        gate = asyncio.Event()
+        a = Chan(1, order)
+        first = asyncio.create_task(sched.low(a.send, "first", gate))
+        await asyncio.sleep(0)
+        rest_ = [asyncio.create_task(sched.low(a.send, "low1")), asyncio.create_task(sched.low(a.send, "low2")),
+                 asyncio.create_task(sched.send(a.send, "send"))]
+        await asyncio.sleep(0.01)
+        gate.set()
+        await asyncio.gather(first, *rest_)
+        return order
+    assert run(scenario()) == ["first", "send", "low1", "low2"]
+
+def test_interaction_messages_have_their_own_bucket():
+    class State:
+        def __init__(self, iid):
+            self._interaction = type("I", (), {"id": iid})()
+
+    class Msg:
+        channel = type("C", (), {"id": 1})()
+
+        def __init__(self, iid):
+            self._state = State(iid)
+
+        async def delete(self):
+            pass
+
+    _, b1 = main.rest_route(Msg(10).delete, ())
+    _, b2 = main.rest_route(Msg(11).delete, ())
+    assert b1 != b2
+
+def test_global_429_and_oversized_timeouts_are_not_double_counted():
+    http = logging.getLogger("discord.http")
+    url = "https://discord.com/api/v10/channels/1393982298654900345/messages"
+    waits, seconds, glob = main.metrics.ratelimit_waits.copy(), main.metrics.ratelimit_wait_seconds, main.metrics.ratelimit_global
+    http.warning("We are being rate limited. %s %s responded with 429. Retrying in %.2f seconds.", "POST", url, 2.0)
+    http.warning("Global rate limit has been hit. Retrying in %.2f seconds.", 2.0)
+    http.warning("We are being rate limited. %s %s responded with 429. Timeout of %.2f was too long, erroring instead.",
+                 "POST", url, 90.0)
+    assert sum((main.metrics.ratelimit_waits - waits).values()) == 1
+    assert main.metrics.ratelimit_wait_seconds - seconds == 2.0
+    assert main.metrics.ratelimit_global - glob == 1
+    assert main.metrics.ratelimit_errors["POST /api/v10/channels/{id}/messages"] >= 1
+
+def test_failed_auto_defer_is_logged_and_counted(run, caplog):
+    class Response:
+        def is_done(self):
+            return False
+
+        async def defer(self, **kwargs):
+            raise main.discord.HTTPException(type("R", (), {"status": 404, "reason": "Not Found"})(), "Unknown interaction")
+
+    class Interaction:
+        id = 1393982298654900347
+        type = None
+        created_at = main.discord.utils.utcnow()
+        response = Response()
+        followup = None
+
+    async def slow(i):
+        await asyncio.sleep(0.01)
+
+    before = main.metrics.ack_defer_failed[slow.__qualname__]
+    with caplog.at_level(logging.WARNING, logger="bot"):
+        run(main.AckWatchdog(0).watch(slow)(Interaction()))
+    assert main.metrics.ack_defer_failed[slow.__qualname__] - before == 1
+    assert any("Defer automatique" in r.getMessage() for r in caplog.records)
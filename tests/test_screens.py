@@ -0,0 +1,80 @@
+import pytest
+
+import main
+from fake_discord import FakeCDN, FakeReference, next_id
+
+@pytest.fixture
+def cdn(run):
+    c = run(FakeCDN(size=4096).start())
+    yield c
+    run(c.stop())
+
+def post_screens(world, cdn, seeds, author=None):
+    m = world.screens.add_message(author or world.passeur, "", attachments=[cdn.attachment(x) for x in seeds])
+    return main.on_message(m)
+
+def gallery(fbm):
+    return [e.image.url for e in fbm.embeds if e.image and e.image.url]
+
+def test_batch_is_one_edit_with_uploads(world, cdn, run, flush):
+    fbm = world.feedback_message(world.passeur, world.client)
+    main.feedback_index_put(world.g.id, world.passeur.id, fbm.id)
+    before = world.rest.calls["message.edit"]
+    run(post_screens(world, cdn, [next_id() for _ in range(3)]))
+    flush()
+    assert world.rest.calls["message.edit"] - before == 1
+    assert len(fbm.uploaded) == 3
+    assert len(fbm.attachments) == 3
+    # Galerie servie par les pièces jointes du feedback, pas par le message d'origine
+    assert all(u.startswith("https://cdn.fake/attachments/") for u in gallery(fbm))
+
+def test_repost_and_duplicates_are_skipped(world, cdn, run, flush):
+    fbm = world.feedback_message(world.passeur, world.client)
+    main.feedback_index_put(world.g.id, world.passeur.id, fbm.id)
+    seed = next_id()
+    run(post_screens(world, cdn, [seed, seed]))
+    flush()
+    assert len(gallery(fbm)) == 1
+    edits = world.rest.calls["message.edit"]
+    run(post_screens(world, cdn, [seed]))
+    flush()
+    assert world.rest.calls["message.edit"] == edits
+    assert len(gallery(fbm)) == 1
+
+def test_gallery_merges_and_caps(world, cdn, run, flush):
+    fbm = world.feedback_message(world.passeur, world.client)
+    main.feedback_index_put(world.g.id, world.passeur.id, fbm.id)
+    run(post_screens(world, cdn, [next_id(), next_id()]))
+    flush()
+    first = gallery(fbm)
+    run(post_screens(world, cdn, [next_id()]))
+    flush()
+    assert gallery(fbm)[:2] == first and len(gallery(fbm)) == 3
+    run(post_screens(world, cdn, [next_id(), next_id()]))
+    flush()
+    assert len(gallery(fbm)) == main.FEEDBACK_GALLERY_MAX
+    assert gallery(fbm)[0] == first[1]
+    # Les pièces jointes sorties de la galerie ne restent pas sur le message
+    assert len(fbm.attachments) == main.FEEDBACK_GALLERY_MAX
+
+def test_reply_screen_survives_reply_deletion(world, cdn, run, flush):
+    fbm = world.feedback_message(world.passeur, world.client)
+    a = cdn.attachment(next_id())
+    reply = world.feedback.add_message(world.client, "voilà", attachments=[a], reference=FakeReference(fbm.id))
+    run(main.on_message(reply))
+    flush()
+    assert reply.deleted
+    assert gallery(fbm) and a.url not in gallery(fbm)
+    assert fbm.uploaded
+
+def test_reply_order_kept_while_screen_downloads(world, cdn, run, flush):
+    cdn.delay = 0.05  # le screen arrive après la réponse suivante
+    fbm = world.feedback_message(world.passeur, world.client)
+    first = world.feedback.add_message(world.client, "first (with screen)", attachments=[cdn.attachment(next_id())],
+                                       reference=FakeReference(fbm.id))
+    second = world.feedback.add_message(world.client, "second", reference=FakeReference(fbm.id))
+    run(main.on_message(first))
+    run(main.on_message(second))
+    flush()
+    assert [r["text"] for r in main.comments_page(fbm.id, 0, 10)] == ["first (with screen)", "second"]
+    assert len(gallery(fbm)) == 1
@@ -0,0 +1,46 @@
+import asyncio
+
+import main
+from fake_discord import FakeGuild, FakeInteraction, next_id
+
+def partner_guild(world):
+    """Guilde partenaire fraîchement activée : aucune catégorie configurée (new_category_id = 0)."""
+    g = FakeGuild(world.rest, next_id(), world.me)
+    g.add_member(world.client)
+    main.guild_configs.update(g.id, "demands_channel_id", str(g.add_text_channel(next_id(), "demandes").id))
+    return g
+
+def confirm(world, g, user):
+    st = main.wizards.new(main.base36(next_id()), user.id, "Pandala", "Tanu")
+    st.dispo = "now"
+    i = FakeInteraction(world.rest, g, user)
+    return main.MultiStepView(st).create(i)
+
+def test_ticket_without_category(world, run):
+    g = partner_guild(world)
+    run(confirm(world, g, world.client))
+    tickets = [c for c in g.channels.values() if c.name.startswith(f"{main.TICKET_PREFIX}-")]
+    assert len(tickets) == 1 and tickets[0].category_id is None
+    assert main.ticket_get(tickets[0].id) is not None
+
+def test_numbering_is_per_guild(world, run):
+    g = partner_guild(world)
+    assert run(main.next_ticket_name(g.id, None, "x")) == "x-001"
+    assert run(main.next_ticket_name(g.id, None, "x")) == "x-002"
+    assert run(main.next_ticket_name(next_id(), None, "x")) == "x-001"
+
+def test_concurrent_creations_overflow_before_the_cache_updates(world, run):
+    g = partner_guild(world)
+    main_cat, overflow = g.add_category(next_id()), g.add_category(next_id())
+    main.guild_configs.update(g.id, "new_category_id", str(main_cat.id))
+    main.guild_configs.update(g.id, "overflow_category_ids", str(overflow.id))
+    for k in range(main.CATEGORY_CHANNEL_LIMIT - 1):
+        g.add_text_channel(next_id(), f"old-{k}", main_cat)
+    g.gateway_lag = True
+
+    async def both():
+        await asyncio.gather(confirm(world, g, world.client), confirm(world, g, world.client))
+    run(both())
+    g.deliver_events()
+    assert len(main_cat.text_channels) == main.CATEGORY_CHANNEL_LIMIT
+    assert len(overflow.text_channels) == 1
@@ -0,0 +1,14 @@
+import main
+
+def test_evicted_session_is_read_from_the_journal():
+    store = main.WizardStore(ttl=600, max_cached=2)
+    first = store.new("s1", 1, "Pandala", "Tanu")
+    first.stage = "disp"
+    store.touch(first)
+    store.new("s2", 1, "Pandala", "Tanu")
+    store.new("s3", 1, "Pandala", "Tanu")  # s1 sort du cache avant tout flush
+    assert store.get("s1") is first
+    store.drop("s2")
+    assert store.get("s2") is None
+    store.flush()
+    assert store.get("s1").stage == "disp"  # relu depuis SQLite